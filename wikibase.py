@@ -14,11 +14,18 @@ import shutil
 import subprocess
 import time
 import wikibase_config
-import wikibase_import
+import wikibase_extensions
+import wikibase_health
+import wikibase_manifest
+import wikibase_rebuild
+import wikibase_trace
+import wikibase_uri_store
+import wikibase_wqs
 import yaml
 
 from os import getcwd, path, chdir
 from pathlib import Path
+from wikibase_session import CommandSession
 
 wd = os.getcwd()
 
@@ -53,6 +60,11 @@ def main():
     parser.add_argument('-visualize', default=False, action='store_true')
     parser.add_argument('-rebuild', default=False, action='store_true')
     parser.add_argument('-wqs', default=False, action='store_true')
+    parser.add_argument('-wqs_full', default=False, action='store_true')
+    parser.add_argument('-no_cache', default=False, action='store_true')
+    parser.add_argument('-clear_cache', default=False, action='store_true')
+    parser.add_argument('-trace', default=False, action='store_true')
+    parser.add_argument('-resume', default=False, action='store_true')
     args=parser.parse_args()
 
     # Read in YAML file.
@@ -62,7 +74,28 @@ def main():
     wikibase_release_pipeline_dir="./target/"+str(repo)+"/src/scripts/wikibase-release-pipeline"
     deploy_dir=wikibase_release_pipeline_dir+"/deploy"
 
+    # Record phases and commands; the summary is printed at exit.
+    if args.trace:
+        wikibase_trace.start_tracing(yaml_dict)
+
+    # Skip operations an interrupted import already applied.
+    if args.resume:
+        if not yaml_dict["wikibase"].get("sync"):
+            yaml_dict["wikibase"]["sync"] = {}
+        yaml_dict["wikibase"]["sync"]["resume"] = True
+
+    # Set up the parsed-graph cache (set up by import_files when importing).
+    if args.no_cache:
+        if not yaml_dict["wikibase"].get("sync"):
+            yaml_dict["wikibase"]["sync"] = {}
+        yaml_dict["wikibase"]["sync"]["graph_cache_mb"] = 0
+    if args.clear_cache:
+        import wikibase_cache
+        wikibase_cache.clear_cache(yaml_dict)
+
     if args.test:
+        # The import modules are only loaded when needed, so load them here.
+        import wikibase_import
         print("All packages correctly installed. Exiting...")
         exit()
     elif args.startover:
@@ -70,7 +103,7 @@ def main():
         run_docker_compose_stop(deploy_dir)
 
         # Put down Docker containers.
-        run_docker_compose_down(deploy_dir)
+        run_docker_compose_down(deploy_dir, yaml_dict)
 
         # Delete configuration.
         delete_configuration(deploy_dir)
@@ -82,7 +115,7 @@ def main():
         set_up_configuration_template(deploy_dir, yaml_dict)
 
         # Put up Docker containers.
-        run_docker_compose_up(deploy_dir)
+        run_docker_compose_up(deploy_dir, yaml_dict=yaml_dict)
 
         # Install packages (note that zip must be installed for the Composer install to function).
         #install_packages(yaml_dict)
@@ -101,14 +134,14 @@ def main():
         set_up_configuration_template(deploy_dir, yaml_dict)
 
         # Put up Docker containers.
-        run_docker_compose_up(deploy_dir)
+        run_docker_compose_up(deploy_dir, yaml_dict=yaml_dict)
 
     elif args.stop and args.down:
         # Stop Docker containers.
         run_docker_compose_stop(deploy_dir)
 
         # Put down Docker containers.
-        run_docker_compose_down(deploy_dir)
+        run_docker_compose_down(deploy_dir, yaml_dict)
 
     elif args.stop:
         # Stop Docker containers.
@@ -116,11 +149,11 @@ def main():
 
     elif args.down:
         # Put down Docker containers.
-        run_docker_compose_down(deploy_dir)
+        run_docker_compose_down(deploy_dir, yaml_dict)
 
     elif args.rebuild:
-        # Run rebuild.
-        run_rebuild()
+        # Run every rebuild step, whether or not it is stale.
+        wikibase_rebuild.run_rebuild(yaml_dict, force=True)
 
     elif args.reset:
         # Reset Docker containers.
@@ -159,8 +192,8 @@ def main():
         # Import from RDF files.
         import_files(yaml_dict)
 
-        # Run rebuild.
-        run_rebuild()
+        # Run the rebuild steps the import made stale.
+        wikibase_rebuild.run_rebuild(yaml_dict)
 
     elif args.tileserver:
 
@@ -172,34 +205,27 @@ def main():
         # Set up visualizer.
         set_up_visualizer()
 
-    elif args.wqs:
-
-        # Export RDF from Wikibase instance.
-        export_rdf()
-
-        # Massage data in correct format for query service.
-        munge(yaml_dict)
+    elif args.wqs or args.wqs_full:
 
-        # Import data into the query service.
-        load_data()
+        # Update the query service with the entities changed since the last
+        # update, or reload it entirely.
+        update_query_service(yaml_dict, full=args.wqs_full)
     
     else:
         run_docker_compose_stop(deploy_dir)
-        run_docker_compose_down(deploy_dir)
+        run_docker_compose_down(deploy_dir, yaml_dict)
         delete_configuration(deploy_dir)
         download_wikibase_release_pipeline(repo)
         #load_extensions(yaml_dict, install_at_build_time=True)
         delete_configuration(deploy_dir)
         set_up_configuration_template(deploy_dir, yaml_dict)
-        run_docker_compose_up(deploy_dir, wait=True)
+        run_docker_compose_up(deploy_dir, wait=True, yaml_dict=yaml_dict)
         #install_packages(yaml_dict)
         set_up_wikibase_quality_constraints(yaml_dict)
         wikibase_config.set_string_limits(yaml_dict)
         import_files(yaml_dict, reset_internal_state=True)
-        run_rebuild()
-        export_rdf()
-        munge(yaml_dict)
-        load_data()
+        wikibase_rebuild.run_rebuild(yaml_dict)
+        update_query_service(yaml_dict, full=True)
 
 # Makes modifications to .env based on a YAML file.
 def make_modifications(yaml_dict, deploy_dir):
@@ -207,6 +233,7 @@ def make_modifications(yaml_dict, deploy_dir):
         replace_in_file(deploy_dir+"/.env", "WIKIBASE_PUBLIC_HOST=wikibase.example.com", "WIKIBASE_PUBLIC_HOST="+yaml_dict["wikibase"]["wikibase_public_host"])
 
 # Downloads the Wikibase Release Pipeline from GitHub.
+@wikibase_trace.phase
 def download_wikibase_release_pipeline(repo):
 
     wikibase_release_pipeline_dir="./target/"+str(repo)+"/src/scripts/wikibase-release-pipeline"
@@ -240,6 +267,7 @@ def download_wikibase_release_pipeline(repo):
         exit()
 
 # Sets up the configruation template for the Wikibase instance.
+@wikibase_trace.phase
 def set_up_configuration_template(deploy_dir, yaml_dict=None):
 
     # Create .env file.
@@ -255,15 +283,23 @@ def set_up_configuration_template(deploy_dir, yaml_dict=None):
         make_modifications(yaml_dict, deploy_dir)
 
 # Runs Docker compose up.
-def run_docker_compose_up(deploy_dir, wait=False):
+@wikibase_trace.phase
+def run_docker_compose_up(deploy_dir, wait=False, yaml_dict=None):
     if path.exists(deploy_dir):
+        started_at = time.monotonic()
         chdir(deploy_dir)
         if wait:
             subprocess.run("docker compose up --wait", shell=True)
         else:
             subprocess.run("docker compose up", shell=True)
         chdir(wd)
-        if False in list(check_all_containers(container_list).values()):
+
+        # Poll until every container is healthy or the startup timeout passes.
+        timeout = 600
+        if yaml_dict and "startup_timeout" in yaml_dict["wikibase"]:
+            timeout = yaml_dict["wikibase"]["startup_timeout"]
+        snapshot, time_to_healthy = wikibase_health.wait_for_containers(container_list, timeout=timeout, started_at=started_at)
+        if not wikibase_health.all_healthy(snapshot):
             print("At least one of the required containers is unhealthy or not running. Exiting...")
             exit()
     else:
@@ -271,6 +307,7 @@ def run_docker_compose_up(deploy_dir, wait=False):
         exit()
 
 # Runs Docker compose stop.
+@wikibase_trace.phase
 def run_docker_compose_stop(deploy_dir):
     if path.exists(deploy_dir):
         chdir(deploy_dir)
@@ -280,30 +317,36 @@ def run_docker_compose_stop(deploy_dir):
         print("Deploy directory path does not exist. Skipping...")
 
 # Runs Docker compose down.
-def run_docker_compose_down(deploy_dir):
+@wikibase_trace.phase
+def run_docker_compose_down(deploy_dir, yaml_dict=None):
     if path.exists(deploy_dir):
         chdir(deploy_dir)
         subprocess.run("docker compose down --volumes", shell=True)
         chdir(wd)
+
+        # Volumes are gone, so nothing recorded as imported is in the Wikibase anymore.
+        if yaml_dict:
+            wikibase_manifest.clear_manifest(yaml_dict)
+            wikibase_wqs.clear_touched_entities(yaml_dict)
+            wikibase_uri_store.clear_uri_store(yaml_dict)
+            # A fresh instance needs every rebuild step.
+            wikibase_rebuild.mark_stale(yaml_dict, *wikibase_rebuild.ALL_INPUTS)
     else:
         print("Deploy directory path does not exist. Skipping...")
 
-# Check all containers.
+# Check all containers are up and healthy (one snapshot for all of them).
 def check_all_containers(container_list):
     container_dict = {}
-    for container_name in container_list:
-        container_dict[container_name] = check_container(container_name)
+    for container_name, state in wikibase_health.snapshot_containers(container_list).items():
+        container_dict[container_name] = state["healthy"]
     return container_dict
 
-# Check container is up.
+# Check container is up and healthy.
 def check_container(container_name):
-    s = str(subprocess.check_output('docker ps', shell=True))
-    if s.find(container_name) != -1:
-        return True
-    else:
-        return False
+    return check_all_containers([container_name])[container_name]
 
 # Deletes the Docker configuration.
+@wikibase_trace.phase
 def delete_configuration(deploy_dir):
     try:
         os.remove(deploy_dir+'/config/LocalSettings.php')
@@ -311,12 +354,13 @@ def delete_configuration(deploy_dir):
         pass
 
 # Resets the Docker configuration.
+@wikibase_trace.phase
 def reset_configuration(deploy_dir, yaml_dict=None):
     delete_configuration(deploy_dir, yaml_dict)
-    run_docker_compose_down(deploy_dir)
+    run_docker_compose_down(deploy_dir, yaml_dict)
     if yaml_dict:
         make_modifications(deploy_dir, yaml_dict)
-    run_docker_compose_up(deploy_dir)
+    run_docker_compose_up(deploy_dir, yaml_dict=yaml_dict)
 
 # Replaces a line in a file with another line."
 def replace_in_file(file_path, search_text, new_text):
@@ -326,29 +370,36 @@ def replace_in_file(file_path, search_text, new_text):
             print(new_line, end='')
 
 # Install packages (note that zip must be installed for the Composer install to function).
+@wikibase_trace.phase
 def install_packages(yaml_dict, install_at_build_time=True):
-    # Run update.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "apt-get -y update"', shell=True)
+    with CommandSession() as session:
+        # Run update.
+        session.queue("apt-get -y update")
 
-    # Install packages.
-    for package in yaml_dict['wikibase']['packages']:
-        subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "apt-get -y install %s"' % str(package), shell=True)
+        # Install packages.
+        for package in yaml_dict['wikibase']['packages']:
+            session.queue("apt-get -y install %s" % str(package))
+    session.report()
 
 # Install Composer in Docker container.
+@wikibase_trace.phase
 def install_composer():
-    # Copy script into container.
-    subprocess.run("docker cp install_composer.sh wbs-deploy-wikibase-1:/var/tmp/install_composer.sh", shell=True)
+    with CommandSession() as session:
+        # Copy script into container.
+        session.queue_file("install_composer.sh", "/var/tmp/install_composer.sh")
 
-    # Run script.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "/var/tmp/install_composer.sh"', shell=True)
+        # Run script.
+        session.queue("bash /var/tmp/install_composer.sh")
 
-    # Remove script.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "rm /var/tmp/install_composer.sh"', shell=True)
+        # Remove script.
+        session.queue("rm /var/tmp/install_composer.sh")
 
-    # Run update.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/update.php --force"', shell=True)
+        # Run update.
+        session.queue("php /var/www/html/maintenance/update.php --force")
+    session.report()
 
 # Clone and load extensions.
+@wikibase_trace.phase
 def load_extensions(yaml_dict, persist_on_host=True, install_at_build_time=True):
 
     if install_at_build_time:
@@ -413,48 +464,25 @@ def load_extensions(yaml_dict, persist_on_host=True, install_at_build_time=True)
 
     else:
 
-        # Download, copy, and load each extension.
-        for extension in yaml_dict['wikibase']['extensions']:
-            # Check if the extension exists already in the container.
-            try:
-                path_exists_str=str(subprocess.check_output('docker exec wbs-deploy-wikibase-1 //bin//bash -c "test -d /var/www/html/extensions/%s" && echo True' % str(extension), shell=True).decode('utf8')).strip()
-            except subprocess.CalledProcessError:
-                path_exists_str=False
-            path_exists=False
-            if path_exists_str == "True":
-                path_exists=True
-
-            if not path_exists:
-
-                # Make extension path.
-                host_extension_path=os.path.join(os.environ['TEMP'], "%s" % str(extension))
-
-                # Clone extension.
-                if not path.exists(host_extension_path):
-                    subprocess.run("git clone -b REL1_41 https://gerrit.wikimedia.org/r/p/mediawiki/extensions/%s.git %s" % (str(extension), str(host_extension_path)), shell=True)
+        # Fetch the extensions that are not in the container yet (from a mirror
+        # cache on the host) and copy them in.
+        wikibase_extensions.install_missing_extensions(yaml_dict['wikibase']['extensions'], persist_on_host=persist_on_host)
 
-                # Copy extension to container.
-                subprocess.run("docker cp %s wbs-deploy-wikibase-1:/var/www/html/extensions/%s" % (str(host_extension_path), str(extension)), shell=True)
+        with CommandSession() as session:
+            # Send over script to check LocalSettings.php.
+            session.queue_file("check_local_settings.sh", "/var/tmp/check_local_settings.sh")
 
-                # Delete extension on host.
-                if not persist_on_host:
-                    try:
-                        shutil.rmtree(host_extension_path) # Permission error still happening?
-                    except FileNotFoundError:
-                        pass
+            # Load extensions in LocalSettings.php (if they don't exist there already).
+            extensions_to_check=" ".join(yaml_dict['wikibase']['extensions'])
 
-        # Send over script to check LocalSettings.php.
-        subprocess.run("docker cp check_local_settings.sh wbs-deploy-wikibase-1:/var/tmp/check_local_settings.sh", shell=True)
+            # Run script.
+            session.queue("bash /var/tmp/check_local_settings.sh %s" % (str(extensions_to_check)))
 
-        # Load extensions in LocalSettings.php (if they don't exist there already).
-        extensions_to_check=" ".join(yaml_dict['wikibase']['extensions'])
-
-        # Run script.
-        subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "/var/tmp/check_local_settings.sh %s"' % (str(extensions_to_check)), shell=True)
-
-        # Remove script.
-        subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "rm /var/tmp/check_local_settings.sh"', shell=True)
+            # Remove script.
+            session.queue("rm /var/tmp/check_local_settings.sh")
+        session.report()
 
+@wikibase_trace.phase
 def set_up_wikibase_quality_constraints(yaml_dict, load_extensions=False):
     if "quality_constraints_mappings" in yaml_dict["wikibase"]:
         print("Not yet implemented.")
@@ -475,31 +503,33 @@ def set_up_wikibase_quality_constraints(yaml_dict, load_extensions=False):
                 load_extensions(new_quick_yaml, install_at_build_time=False)
 
                 # TODO: Make sure this doesn't run if already run? This should work, but it's just a stop-gap measure.
-                subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/update.php --quick"', shell=True)
-                subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/run.php WikibaseQualityConstraints:ImportConstraintEntities.php | tee -a /var/www/html/LocalSettings.php"', shell=True)
-                subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/runJobs.php"', shell=True)
+                with CommandSession() as session:
+                    session.queue("php /var/www/html/maintenance/update.php --quick")
+                    session.queue("php /var/www/html/maintenance/run.php WikibaseQualityConstraints:ImportConstraintEntities.php | tee -a /var/www/html/LocalSettings.php")
+                    session.queue("php /var/www/html/maintenance/runJobs.php")
+                session.report()
 
         # TODO: Add to rebuild recent changes.
 
+@wikibase_trace.phase
 def import_files(yaml_dict, reset_internal_state=False):
     if "import" in yaml_dict["wikibase"]:
+        # Loaded here rather than at startup: it pulls in rdflib, wbsync and
+        # wikidataintegrator, which the other commands do not need.
+        import wikibase_import
+        wikibase_import.init_graph_cache(yaml_dict)
         if reset_internal_state:
             wikibase_import.init_factory(yaml_dict)
         local_settings_dict = wikibase_config.get_local_settings()
-        wikibase_import.import_from_file(yaml_dict, local_settings_dict)
+        stats = wikibase_import.import_from_file(yaml_dict, local_settings_dict)
+        # Unchanged files and imports with nothing to apply leave the rebuild
+        # state as it was.
+        if stats.applied() > 0:
+            wikibase_rebuild.mark_stale(yaml_dict, wikibase_rebuild.ENTITIES)
     else:
         pass
 
-def run_rebuild():
-    # Send over rebuild script.
-    subprocess.run("docker cp wikibase_rebuild.sh wbs-deploy-wikibase-1:/var/tmp/wikibase_rebuild.sh", shell=True)
-
-    # Run rebuild script.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "/var/tmp/wikibase_rebuild.sh"', shell=True)
-
-    # Remove rebuild script.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "rm /var/tmp/wikibase_rebuild.sh"', shell=True)
-    
+@wikibase_trace.phase
 def install_rdfsync(yaml_dict):
     # Check if wikibase-sync has been downloaded; if not begin downloading.
     rdf_sync_dir="./target/"+yaml_dict['repo']+"/src/scripts/rdfsync"
@@ -537,26 +567,47 @@ def set_up_visualizer(visualizer='KinGVisher'):
         print("Visualizer not recognized. Exiting...")
         exit()
 
-def export_rdf():
-    # Adapted from: https://thisismattmiller.com/post/migrating-your-docker-wikibase/
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/extensions/Wikibase/repo/maintenance/dumpRdf.php > /tmp/backup.ttl"', shell=True)
-
-def munge(yaml_dict):
+# Munges an RDF dump already in the query service container (see
+# wikibase_wqs.stream_rdf). Returns True on success.
+@wikibase_trace.phase
+def munge(yaml_dict, rdf_path):
     if "wikibase_public_host" in yaml_dict["wikibase"]:
-        # Adapted from: https://thisismattmiller.com/post/migrating-your-docker-wikibase/
-        host_rdf_path=os.path.join(os.environ['TEMP'], "%s" % str("backup.ttl"))
-        subprocess.run("docker cp wbs-deploy-wikibase-1:/tmp/backup.ttl " + host_rdf_path, shell=True)
-        subprocess.run("docker cp " + host_rdf_path + " wbs-deploy-wdqs-1:/tmp/backup.ttl", shell=True)
-
         # TODO: Fix to dynamically change.
-        subprocess.run('docker exec wbs-deploy-wdqs-1 //bin//bash -c "./munge.sh -f /tmp/backup.ttl -- --conceptUri ' + 'https://' + yaml_dict["wikibase"]["wikibase_public_host"] + '"', shell=True)
+        start=time.perf_counter()
+        result = subprocess.run('docker exec wbs-deploy-wdqs-1 //bin//bash -c "./munge.sh -f ' + rdf_path + ' -- --conceptUri ' + 'https://' + yaml_dict["wikibase"]["wikibase_public_host"] + '"', shell=True)
+        print("Munged %s in %.1fs (exit %d)." % (rdf_path, time.perf_counter()-start, result.returncode))
+        return result.returncode == 0
     else:
         print("No public host declared. Exiting...")
         exit()
 
+# Loads the munged dump into the query service. Returns True on success.
+@wikibase_trace.phase
 def load_data():
     # Adapted from: https://thisismattmiller.com/post/migrating-your-docker-wikibase/
-    subprocess.run('docker exec wbs-deploy-wdqs-1 //bin//bash -c "./loadData.sh -n wdq -d /wdqs/"', shell=True)
+    result = subprocess.run('docker exec wbs-deploy-wdqs-1 //bin//bash -c "./loadData.sh -n wdq -d /wdqs/"', shell=True)
+    return result.returncode == 0
+
+# Brings the query service up to date. Unless full is set, only the entities
+# touched by imports since the last update are replaced; a full export,
+# munge and reload is the fallback whenever that is not possible. The touched
+# entities are only reset once a load has succeeded; after a failed full
+# reload they are forgotten, so that the next update is a full reload too.
+@wikibase_trace.phase
+def update_query_service(yaml_dict, full=False):
+    if not full and wikibase_wqs.sync_incremental(yaml_dict):
+        return
+    rdf_path = wikibase_wqs.stream_rdf(yaml_dict)
+    if rdf_path is None:
+        print("Could not export the RDF dump into the query service container.")
+    elif not munge(yaml_dict, rdf_path):
+        print("Munging the RDF dump failed.")
+    elif not load_data():
+        print("Loading the RDF dump into the query service failed.")
+    else:
+        wikibase_wqs.reset_touched_entities(yaml_dict)
+        return
+    wikibase_wqs.clear_touched_entities(yaml_dict)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
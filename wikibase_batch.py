@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_batch.py
+#
+
+import json
+import requests
+import threading
+import time
+
+from decimal import Decimal, InvalidOperation
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import RDFS, SKOS
+from wikibase_executor import get_op_subject, get_op_triple
+from wikibase_failures import AMBIGUOUS, NO_RETRY, classify_error
+
+# Predicates written as entity terms rather than statements.
+LABEL_PREDICATES = frozenset([RDFS.label, SKOS.prefLabel])
+DESCRIPTION_PREDICATES = frozenset([RDFS.comment])
+ALIAS_PREDICATES = frozenset([SKOS.altLabel])
+TERM_PREDICATES = LABEL_PREDICATES | DESCRIPTION_PREDICATES | ALIAS_PREDICATES
+
+# Wikibase limits descriptions to 250 characters by default.
+MAX_DESCRIPTION_LENGTH = 250
+
+# wbgetentities accepts at most 50 IDs per request.
+GET_ENTITIES_CHUNK_SIZE = 50
+
+# A logged-in MediaWiki action API session for wbeditentity/wbgetentities.
+class MediaWikiSession:
+
+    def __init__(self, api_url, username, password, verify=True, maxlag=5):
+        self.api_url = api_url
+        self.username = username
+        self.password = password
+        self.maxlag = maxlag
+        self.calls = 0
+        self._session = requests.Session()
+        self._session.verify = verify
+        self._csrf_token = None
+        self._lock = threading.Lock()
+        # Separate from _lock, which is held while logging in.
+        self._calls_lock = threading.Lock()
+
+    def request(self, method, params):
+        params = dict(params, format="json")
+        with self._calls_lock:
+            self.calls += 1
+        if method == "GET":
+            response = self._session.get(self.api_url, params=params, timeout=60)
+        else:
+            response = self._session.post(self.api_url, data=params, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def login(self):
+        login_token = self.request("GET", {"action": "query", "meta": "tokens", "type": "login"})["query"]["tokens"]["logintoken"]
+        result = self.request("POST", {"action": "login", "lgname": self.username, "lgpassword": self.password, "lgtoken": login_token})
+        if result.get("login", {}).get("result") != "Success":
+            raise RuntimeError("Login as %s failed: %s" % (self.username, result))
+        self._csrf_token = self.request("GET", {"action": "query", "meta": "tokens"})["query"]["tokens"]["csrftoken"]
+
+    def get_csrf_token(self):
+        with self._lock:
+            if self._csrf_token is None:
+                self.login()
+            return self._csrf_token
+
+    def get_entities(self, entity_ids, props="datatype"):
+        entities = {}
+        entity_ids = sorted(set(entity_ids))
+        for i in range(0, len(entity_ids), GET_ENTITIES_CHUNK_SIZE):
+            result = self.request("GET", {"action": "wbgetentities", "ids": "|".join(entity_ids[i:i + GET_ENTITIES_CHUNK_SIZE]), "props": props})
+            entities.update(result.get("entities", {}))
+        return entities
+
+    # Applies an entity payload in one edit; returns the API response.
+    def edit_entity(self, entity_id, data, summary="Batched synchronization"):
+        params = {"action": "wbeditentity", "id": entity_id, "data": json.dumps(data), "summary": summary,
+            "token": self.get_csrf_token(), "bot": 1}
+        if self.maxlag:
+            params["maxlag"] = self.maxlag
+        result = self.request("POST", params)
+        if result.get("error", {}).get("code") == "badtoken":
+            with self._lock:
+                self._csrf_token = None
+            params["token"] = self.get_csrf_token()
+            result = self.request("POST", params)
+        return result
+
+def get_numeric_id(entity_id):
+    return int(entity_id[1:])
+
+# Returns the datavalue of a term for a property of the given datatype, or
+# None if the term cannot be written as that datatype.
+def build_datavalue(term, datatype, resolve_entity_id):
+    if datatype in ("wikibase-item", "wikibase-property"):
+        if not isinstance(term, URIRef):
+            return None
+        entity_id = resolve_entity_id(term)
+        if entity_id is None or (datatype == "wikibase-item") != entity_id.startswith("Q"):
+            return None
+        entity_type = "item" if datatype == "wikibase-item" else "property"
+        return {"type": "wikibase-entityid", "value": {"entity-type": entity_type, "numeric-id": get_numeric_id(entity_id), "id": entity_id}}
+    if datatype in ("string", "external-id"):
+        if isinstance(term, Literal) and not term.language:
+            return {"type": "string", "value": str(term)}
+        return None
+    if datatype == "url":
+        if isinstance(term, (URIRef, Literal)):
+            return {"type": "string", "value": str(term)}
+        return None
+    if datatype == "monolingualtext":
+        if isinstance(term, Literal) and term.language:
+            return {"type": "monolingualtext", "value": {"text": str(term), "language": term.language}}
+        return None
+    if datatype == "quantity":
+        if isinstance(term, Literal):
+            try:
+                amount = Decimal(str(term))
+            except InvalidOperation:
+                return None
+            if not amount.is_finite():
+                return None
+            # Wikibase wants a signed decimal without an exponent.
+            return {"type": "quantity", "value": {"amount": "{:+f}".format(amount), "unit": "1"}}
+        return None
+    return None
+
+# Coalesces the addition operations of one subject into a single wbeditentity
+# payload: labels, descriptions, aliases and statements for properties with a
+# known datatype. Operations that cannot be expressed in the payload are
+# returned so that they can be applied one by one.
+def build_entity_payload(ops, resolve_entity_id, get_property_datatype):
+    data = {"labels": {}, "descriptions": {}, "aliases": {}, "claims": []}
+    batched = []
+    rest = []
+    for op in ops:
+        _, predicate, obj = get_op_triple(op)
+        language = obj.language if isinstance(obj, Literal) else None
+        if predicate in LABEL_PREDICATES and language and language not in data["labels"]:
+            data["labels"][language] = {"language": language, "value": str(obj)}
+        elif predicate in DESCRIPTION_PREDICATES and language and language not in data["descriptions"] and len(obj) <= MAX_DESCRIPTION_LENGTH:
+            data["descriptions"][language] = {"language": language, "value": str(obj)}
+        elif predicate in ALIAS_PREDICATES and language:
+            data["aliases"].setdefault(language, []).append({"language": language, "value": str(obj)})
+        else:
+            property_id = resolve_entity_id(predicate)
+            datatype = get_property_datatype(property_id) if property_id and property_id.startswith("P") else None
+            datavalue = build_datavalue(obj, datatype, resolve_entity_id) if datatype else None
+            if datavalue is None:
+                rest.append(op)
+                continue
+            data["claims"].append({"mainsnak": {"snaktype": "value", "property": property_id, "datavalue": datavalue},
+                "type": "statement", "rank": "normal"})
+        batched.append(op)
+    data = dict((key, value) for key, value in data.items() if value)
+    return data, batched, rest
+
+# Applies the additions of one subject with a single wbeditentity call where
+# possible. Subjects that are not in the Wikibase yet get their first
+# operation applied through the adapter, which creates the entity.
+# Everything else (removals, blank nodes, unknown properties or datatypes)
+# falls back to per-triple execution.
+class EntityBatcher:
+
+    def __init__(self, session, resolve_entity_id, addition_type="AdditionOperation"):
+        self.session = session
+        self.resolve_entity_id = resolve_entity_id
+        self.addition_type = addition_type
+        self.datatypes = {}
+        self.edits = 0
+        self._lock = threading.Lock()
+
+    # Returns the datatype of a property, looking it up if it is not known
+    # yet. The lock is not held during the lookup, so other workers are not
+    # blocked by it; two workers may look up the same property at once.
+    def get_property_datatype(self, property_id):
+        with self._lock:
+            if property_id in self.datatypes:
+                return self.datatypes[property_id]
+        datatype = self.session.get_entities([property_id]).get(property_id, {}).get("datatype")
+        with self._lock:
+            self.datatypes[property_id] = datatype
+        return datatype
+
+    # Looks up the datatypes of several properties in bulk.
+    def prefetch_datatypes(self, property_ids):
+        with self._lock:
+            missing = [property_id for property_id in set(property_ids) if property_id not in self.datatypes]
+        if missing:
+            entities = self.session.get_entities(missing)
+            with self._lock:
+                for property_id in missing:
+                    self.datatypes[property_id] = entities.get(property_id, {}).get("datatype")
+
+    def is_batchable(self, op):
+        return type(op).__name__ == self.addition_type and not isinstance(get_op_subject(op), BNode)
+
+    # Splits a subject's operations into runs of batchable additions and single
+    # other operations, keeping their order.
+    def plan(self, group):
+        steps = []
+        for op in group:
+            if self.is_batchable(op) and steps and isinstance(steps[-1], list):
+                steps[-1].append(op)
+            elif self.is_batchable(op):
+                steps.append([op])
+            else:
+                steps.append(op)
+        return steps
+
+    # Writes a run of additions for an existing entity. Returns the operations
+    # that were applied, those left for per-triple execution and those whose
+    # edit may or may not have been applied (after a read timeout, say), which
+    # must not be written again.
+    def write_batch(self, entity_id, ops, retry_policy=NO_RETRY):
+        data, batched, rest = build_entity_payload(ops, self.resolve_entity_id, self.get_property_datatype)
+        if len(batched) < 2:
+            return [], ops, []
+        attempt = 0
+        while True:
+            attempt += 1
+            error = None
+            try:
+                result = self.session.edit_entity(entity_id, data)
+                if "error" not in result:
+                    with self._lock:
+                        self.edits += 1
+                    return batched, rest, []
+                message = "%s: %s" % (result["error"].get("code"), result["error"].get("info"))
+            except Exception as e:
+                error = e
+                message = "%s: %s" % (type(e).__name__, e)
+            kind = classify_error(error, message, idempotent=False)
+            if retry_policy.should_retry(kind, attempt):
+                time.sleep(retry_policy.get_delay(attempt))
+                continue
+            if kind == AMBIGUOUS:
+                print("Batched edit of %s may have been applied (%s); check it before replaying its triples." % (entity_id, message))
+                return [], rest, batched
+            print("Batched edit of %s failed (%s), applying its triples one by one: %s" % (entity_id, kind, message))
+            return [], ops, []
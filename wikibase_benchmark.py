@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_benchmark.py
+#
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import wikibase_batch
+import wikibase_executor
+import wikibase_import
+import wikibase_journal
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from wbsync.triplestore import ModificationResult
+
+BENCHMARK_NAMESPACE = "http://example.org/benchmark/"
+
+def main():
+
+    parser=argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=str, default='100,1000,5000', help='Comma-separated numbers of instances to benchmark.')
+    parser.add_argument('--classes', type=int, required=False, help='Number of classes (default: a tenth of the instances).')
+    parser.add_argument('--properties', type=int, required=False, help='Number of properties (default: a twentieth of the instances).')
+    parser.add_argument('--literals', type=int, required=False, help='Number of literal-valued triples (default: twice the instances).')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every API response of the stub.')
+    parser.add_argument('--sparql_latency', type=float, required=False, help='Seconds added to every SPARQL response (default: --latency).')
+    parser.add_argument('--concurrency', type=int, default=1, help='Concurrency of the synchronization executor.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the ontology generator.')
+    parser.add_argument('--generate', type=str, required=False, help='Only write the ontology for the first size to this file.')
+    parser.add_argument('--serve', type=int, required=False, help='Only run the stub API on this port until interrupted.')
+    parser.add_argument('--smoke', default=False, action='store_true', help='Only run synchronizer-built operations through the executor against a recording adapter.')
+    args=parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    if args.serve is not None:
+        with StubWikibase(port=args.serve, latency=args.latency, sparql_latency=args.sparql_latency) as stub:
+            print("Stub API at %s and SPARQL endpoint at %s. Press Ctrl+C to stop." % (stub.api_url, stub.sparql_url))
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+    elif args.smoke:
+        run_smoke(seed=args.seed, concurrency=max(2, args.concurrency))
+    elif args.generate:
+        params = get_size_params(sizes[0], args.classes, args.properties, args.literals)
+        with open(args.generate, 'w') as f:
+            f.write(generate_ontology(seed=args.seed, **params))
+        print("Wrote %s (%s)." % (args.generate, ", ".join("%s=%d" % item for item in params.items())))
+    else:
+        run_benchmark(sizes, latency=args.latency, sparql_latency=args.sparql_latency, concurrency=args.concurrency,
+            seed=args.seed, classes=args.classes, properties=args.properties, literals=args.literals)
+
+# Returns the generator parameters for a benchmark size (number of instances).
+def get_size_params(instances, classes=None, properties=None, literals=None):
+    return {
+        "classes": classes if classes is not None else max(1, instances // 10),
+        "properties": properties if properties is not None else max(2, instances // 20),
+        "instances": instances,
+        "literals": literals if literals is not None else instances * 2
+    }
+
+def escape_literal(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+# Generates a synthetic OWL ontology as Turtle: a class hierarchy, object and
+# datatype properties, typed instances linked by the object properties, and
+# literal-valued triples spread over the instances. The same arguments always
+# give the same ontology.
+def generate_ontology(classes=10, properties=5, instances=100, literals=200, seed=0):
+    rng = random.Random(seed)
+    object_properties = max(1, properties // 2)
+    datatype_properties = max(1, properties - object_properties)
+    lines = [
+        "@prefix ex: <%s> ." % BENCHMARK_NAMESPACE,
+        "@prefix owl: <http://www.w3.org/2002/07/owl#> .",
+        "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .",
+        "@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .",
+        ""
+    ]
+    for i in range(object_properties):
+        lines.append('ex:objectProperty%d a owl:ObjectProperty ; rdfs:label "object property %d"@en .' % (i, i))
+    for i in range(datatype_properties):
+        lines.append('ex:datatypeProperty%d a owl:DatatypeProperty ; rdfs:label "datatype property %d"@en .' % (i, i))
+    for i in range(classes):
+        statement = 'ex:Class%d a owl:Class ; rdfs:label "class %d"@en' % (i, i)
+        if i > 0:
+            statement += " ; rdfs:subClassOf ex:Class%d" % rng.randrange(i)
+        lines.append(statement + " .")
+    for i in range(instances):
+        statement = 'ex:instance%d a ex:Class%d ; rdfs:label "instance %d"@en' % (i, rng.randrange(classes), i)
+        if i > 0:
+            statement += " ; ex:objectProperty%d ex:instance%d" % (rng.randrange(object_properties), rng.randrange(i))
+        lines.append(statement + " .")
+    for i in range(literals):
+        subject = rng.randrange(instances) if instances else 0
+        if rng.random() < 0.5:
+            lines.append('ex:instance%d ex:datatypeProperty%d "%s" .' % (subject, rng.randrange(datatype_properties),
+                escape_literal("value %d" % i)))
+        else:
+            lines.append('ex:instance%d ex:datatypeProperty%d "%d"^^xsd:integer .' % (subject, rng.randrange(datatype_properties), i))
+    return "\n".join(lines) + "\n"
+
+# Handles requests to the stub; see StubWikibase.
+class StubRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.respond(url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        content_type = self.headers.get("Content-Type", "")
+        if "application/sparql-query" in content_type:
+            params["query"] = [body]
+        elif body:
+            for key, values in parse_qs(body).items():
+                params.setdefault(key, []).extend(values)
+        self.respond(url.path, params)
+
+    def respond(self, path, params):
+        params = dict((key, values[-1]) for key, values in params.items())
+        stub = self.server.stub
+        if path.endswith("/sparql"):
+            stub.count("sparql")
+            stub.wait(stub.sparql_latency)
+            payload = stub.handle_sparql(params.get("query", ""))
+            content_type = "application/sparql-results+json"
+        elif path.endswith("/api.php"):
+            action = params.get("action", "")
+            stub.count(action)
+            stub.wait(stub.latency)
+            payload = stub.handle_api(action, params)
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+# A local stand-in for the MediaWiki/Wikibase action API (/w/api.php) and the
+# query service SPARQL endpoint (/query/sparql), with injectable latency. It
+# keeps entities in memory and answers logins, tokens and the wb* modules
+# the adapter uses; SPARQL queries always return no results. Every request
+# is counted by action.
+class StubWikibase:
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, sparql_latency=None):
+        self.latency = latency
+        self.sparql_latency = latency if sparql_latency is None else sparql_latency
+        self.calls = Counter()
+        self.entities = {}
+        self.next_ids = {"item": 1, "property": 1}
+        self.revision = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), StubRequestHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    @property
+    def api_url(self):
+        return self.url + "/w/api.php"
+
+    @property
+    def sparql_url(self):
+        return self.url + "/query/sparql"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.entities.clear()
+            self.next_ids = {"item": 1, "property": 1}
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def wait(self, latency):
+        if latency > 0:
+            time.sleep(latency)
+
+    def handle_sparql(self, query):
+        if query.lstrip().upper().startswith("ASK") or " ASK " in query.upper():
+            return {"head": {}, "boolean": False}
+        return {"head": {"vars": []}, "results": {"bindings": []}}
+
+    def handle_api(self, action, params):
+        if action == "query":
+            meta = params.get("meta", "")
+            if "tokens" in meta:
+                return {"batchcomplete": "", "query": {"tokens": {"logintoken": "stub+\\", "csrftoken": "stub+\\"}}}
+            if "userinfo" in meta:
+                return {"batchcomplete": "", "query": {"userinfo": {"id": 1, "name": params.get("lgname", "Admin")}}}
+            return {"batchcomplete": "", "query": {}}
+        if action == "login":
+            return {"login": {"result": "Success", "lguserid": 1, "lgusername": params.get("lgname", "Admin")}}
+        if action == "clientlogin":
+            return {"clientlogin": {"status": "PASS", "username": params.get("username", "Admin")}}
+        if action == "wbeditentity":
+            return self.edit_entity(params)
+        if action == "wbgetentities":
+            return self.get_entities(params)
+        if action == "wbsearchentities":
+            return self.search_entities(params)
+        if action in ("wbsetlabel", "wbsetdescription"):
+            return self.set_term(action, params)
+        with self._lock:
+            self.revision += 1
+            return {"success": 1, "pageinfo": {"lastrevid": self.revision}}
+
+    def edit_entity(self, params):
+        data = json.loads(params.get("data") or "{}")
+        with self._lock:
+            self.revision += 1
+            if params.get("new"):
+                entity_type = params["new"]
+                prefix = "P" if entity_type == "property" else "Q"
+                entity_id = "%s%d" % (prefix, self.next_ids.get(entity_type, 1))
+                self.next_ids[entity_type] = self.next_ids.get(entity_type, 1) + 1
+                entity = {"type": entity_type, "id": entity_id, "labels": {}, "descriptions": {}, "aliases": {}, "claims": {}}
+                if entity_type == "property":
+                    entity["datatype"] = data.get("datatype", "string")
+                self.entities[entity_id] = entity
+            else:
+                entity_id = params.get("id", "")
+                entity = self.entities.get(entity_id)
+                if entity is None:
+                    return {"error": {"code": "no-such-entity", "info": "Could not find an entity with the ID \"%s\"." % entity_id}}
+                if params.get("clear"):
+                    entity.update({"labels": {}, "descriptions": {}, "aliases": {}, "claims": {}})
+            for key in ("labels", "descriptions"):
+                for lang, term in (data.get(key) or {}).items():
+                    entity[key][lang] = term
+            for lang, aliases in (data.get("aliases") or {}).items():
+                entity["aliases"].setdefault(lang, []).extend(aliases if isinstance(aliases, list) else [aliases])
+            claims = data.get("claims") or {}
+            if isinstance(claims, dict):
+                claims = [claim for property_claims in claims.values() for claim in property_claims]
+            for claim in claims:
+                property_id = (claim.get("mainsnak") or {}).get("property", "P0")
+                claim.setdefault("id", "%s$%d" % (entity_id, self.revision))
+                entity["claims"].setdefault(property_id, []).append(claim)
+            entity["lastrevid"] = self.revision
+            return {"success": 1, "entity": entity}
+
+    def get_entities(self, params):
+        entities = {}
+        with self._lock:
+            for entity_id in params.get("ids", "").split("|"):
+                if entity_id in self.entities:
+                    entities[entity_id] = self.entities[entity_id]
+                elif entity_id:
+                    entities[entity_id] = {"id": entity_id, "missing": ""}
+        return {"success": 1, "entities": entities}
+
+    def search_entities(self, params):
+        search = params.get("search", "").lower()
+        language = params.get("language", "en")
+        entity_type = params.get("type", "item")
+        matches = []
+        with self._lock:
+            for entity_id, entity in self.entities.items():
+                label = (entity["labels"].get(language) or {}).get("value", "")
+                if entity["type"] == entity_type and label.lower().startswith(search):
+                    matches.append({"id": entity_id, "label": label, "match": {"type": "label", "language": language, "text": label}})
+        return {"success": 1, "searchinfo": {"search": search}, "search": matches}
+
+    def set_term(self, action, params):
+        key = "labels" if action == "wbsetlabel" else "descriptions"
+        with self._lock:
+            self.revision += 1
+            entity = self.entities.get(params.get("id", ""))
+            if entity is not None:
+                language = params.get("language", "en")
+                entity[key][language] = {"language": language, "value": params.get("value", "")}
+            return {"success": 1, "entity": {"id": params.get("id", ""), "lastrevid": self.revision}}
+
+# Returns a project dict that points the adapter at the stub.
+def get_benchmark_yaml(stub, concurrency=1):
+    return {
+        "repo": "benchmark",
+        "wikibase": {
+            "external_host": stub.url,
+            "mw_admin_name": "Admin",
+            "mw_admin_password": "benchmark",
+            "adapter": {"default_lang": "en"},
+            "sync": {"concurrency": concurrency}
+        }
+    }
+
+# Imports a generated ontology of one size into the stub through the same
+# path as a real import (add_content with the Wikibase adapter) and returns
+# its measurements.
+def run_size(yaml_dict, stub, seed=0, **params):
+    target_content = generate_ontology(seed=seed, **params)
+    triples = len(wikibase_import.rdflib.Graph().parse(data=target_content, format="turtle"))
+
+    stub.reset()
+    wikibase_import.init_factory(yaml_dict)
+    # The stub starts empty, so entities from earlier sizes must not resolve.
+    wikibase_import.get_uri_store(yaml_dict).clear()
+    wikibase_import.set_default_lang(yaml_dict)
+    adapter = wikibase_import.set_up_wikibase_adapter(yaml_dict)
+    synchronizer = wikibase_import.init_synchronizer()
+    setup_calls = stub.total_calls()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    stats = wikibase_import.add_content(synchronizer, adapter, target_content, "", yaml_dict=yaml_dict, verbose=False)
+    elapsed = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    api_calls = stub.total_calls() - setup_calls
+    return {
+        "instances": params["instances"],
+        "triples": triples,
+        "ops": stats.total,
+        "failures": stats.failures,
+        "seconds": elapsed,
+        "ops_per_second": stats.total / elapsed if elapsed else 0.0,
+        "api_calls": api_calls,
+        "api_calls_per_triple": api_calls / triples if triples else 0.0,
+        "peak_memory_mb": peak_bytes / 1e6,
+        "p95_latency": stats.percentile(95)
+    }
+
+# Stands in for the Wikibase adapter in the smoke run: records the triples it
+# is asked to create or remove and reports every change as successful.
+class RecordingAdapter:
+
+    def __init__(self):
+        self.created = []
+        self.removed = []
+        self._lock = threading.Lock()
+
+    def create_triple(self, triple_info):
+        with self._lock:
+            self.created.append(triple_info)
+        return ModificationResult(True)
+
+    def remove_triple(self, triple_info):
+        with self._lock:
+            self.removed.append(triple_info)
+        return ModificationResult(True)
+
+# Builds the operations of a small generated ontology with
+# OntologySynchronizer.synchronize, like a real import, and runs them through
+# execute_ops (journal, dependency order and creation guard included) against
+# a recording adapter. This checks that the executor still reads wbsync's
+# operation objects without needing a Wikibase or the stub; it raises if any
+# operation is lost, fails or is left pending in the journal.
+def run_smoke(seed=0, concurrency=2):
+    target_content = generate_ontology(seed=seed, **get_size_params(20))
+    ops = wikibase_import.init_synchronizer().synchronize("", target_content)
+    type_index = wikibase_import.TypeIndex(wikibase_import.rdflib.Graph().parse(data=target_content, format="turtle"))
+    guard = wikibase_executor.CreationGuard(lambda element: False, wikibase_batch.TERM_PREDICATES)
+    adapter = RecordingAdapter()
+    with tempfile.TemporaryDirectory() as journal_dir:
+        journal_path = os.path.join(journal_dir, "smoke.journal")
+        journal = wikibase_journal.OpJournal(journal_path)
+        stats = wikibase_executor.execute_ops(ops, adapter, concurrency=concurrency, verbose=False, journal=journal,
+            ordered=True, type_index=type_index, guard=guard)
+        journal.close()
+        resumed = wikibase_journal.OpJournal(journal_path, resume=True)
+        pending = resumed.pending(ops)
+        resumed.close()
+    applied = len(adapter.created) + len(adapter.removed)
+    if not ops or stats.failures or applied != len(ops) or pending:
+        raise RuntimeError("Smoke run failed: %d operations built, %d applied, %d failed, %d still pending in the journal." % (
+            len(ops), applied, stats.failures, len(pending)))
+    print("Smoke run passed: %d operations built by the synchronizer were applied and journaled." % len(ops))
+    return stats
+
+def report_results(results):
+    print("%10s %9s %9s %9s %9s %10s %11s %10s %11s" % ("Instances", "Triples", "Ops", "Failures", "Seconds", "Ops/s",
+        "API calls", "Calls/trpl", "Peak MB"))
+    for result in results:
+        print("%10d %9d %9d %9d %9.2f %10.1f %11d %10.2f %11.1f" % (result["instances"], result["triples"], result["ops"],
+            result["failures"], result["seconds"], result["ops_per_second"], result["api_calls"],
+            result["api_calls_per_triple"], result["peak_memory_mb"]))
+
+# Runs the import benchmark at each size against a fresh stub and prints a
+# table of ops/s, API calls per triple and peak Python memory.
+def run_benchmark(sizes, latency=0.0, sparql_latency=None, concurrency=1, seed=0, classes=None, properties=None, literals=None):
+    results = []
+    with StubWikibase(latency=latency, sparql_latency=sparql_latency) as stub:
+        yaml_dict = get_benchmark_yaml(stub, concurrency)
+        for size in sizes:
+            params = get_size_params(size, classes, properties, literals)
+            print("Benchmarking %s..." % ", ".join("%s=%d" % item for item in params.items()))
+            results.append(run_size(yaml_dict, stub, seed=seed, **params))
+    report_results(results)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_cache.py
+#
+
+import os
+import pickle
+import shutil
+import wikibase_manifest
+import wikibase_triples
+
+from array import array
+from rdflib import BNode, Graph, Literal, URIRef, __version__ as rdflib_version
+
+# Bump when the on-disk layout changes so that old entries are ignored.
+CACHE_FORMAT_VERSION = 2
+
+CACHE_EXTENSION = ".graph"
+
+# Returns the directory holding cached graphs for a project.
+def get_cache_dir(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), "cache", "graphs")
+
+# Removes every cached graph for a project.
+def clear_cache(yaml_dict):
+    shutil.rmtree(get_cache_dir(yaml_dict), ignore_errors=True)
+
+# Encodes a term as a small tuple that pickles compactly.
+def encode_term(term):
+    if isinstance(term, URIRef):
+        return ('U', str(term))
+    if isinstance(term, BNode):
+        return ('B', str(term))
+    if isinstance(term, Literal):
+        datatype = str(term.datatype) if term.datatype is not None else None
+        return ('L', str(term), datatype, term.language)
+    raise TypeError("Cannot cache term of type %s." % type(term).__name__)
+
+def decode_term(encoded):
+    kind = encoded[0]
+    if kind == 'U':
+        return URIRef(encoded[1])
+    if kind == 'B':
+        return BNode(encoded[1])
+    return Literal(encoded[1], lang=encoded[3], datatype=encoded[2])
+
+# Serializes a graph as the interned term table and the subject, predicate and
+# object columns of an InternedStore (other graphs are copied into one first).
+def dump_graph(g):
+    store = wikibase_triples.get_interned_store(g)
+    if store is None:
+        store = wikibase_triples.InternedStore()
+        for triple in g:
+            store.add(triple)
+    store.compact()
+    terms = [encode_term(term) for term in store.terms]
+    columns = [column.tobytes() for column in (store.subjects, store.predicates, store.objects)]
+    namespaces = [(prefix, str(namespace)) for prefix, namespace in g.namespaces()]
+    return pickle.dumps((CACHE_FORMAT_VERSION, namespaces, terms, columns), protocol=4)
+
+# Returns the cached graph, backed by an InternedStore.
+def load_graph(data):
+    version, namespaces, encoded_terms, column_bytes = pickle.loads(data)
+    if version != CACHE_FORMAT_VERSION:
+        return None
+    columns = []
+    for data in column_bytes:
+        column = array('I')
+        column.frombytes(data)
+        columns.append(column)
+    store = wikibase_triples.InternedStore.from_columns([decode_term(encoded) for encoded in encoded_terms], *columns)
+    g = Graph(store=store)
+    for prefix, namespace in namespaces:
+        g.bind(prefix, namespace, override=True)
+    return g
+
+# On-disk cache of parsed graphs, keyed by file content hash and parser
+# version, evicting the least recently used entries above max_bytes. Set up
+# by wikibase_import.init_graph_cache; both versions of a file being diffed
+# are parsed through it, so a file that was imported before is read back
+# from the cache rather than parsed again.
+class GraphCache:
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def get_entry_path(self, file_hash):
+        key = "%s-rdflib%s-v%d" % (file_hash, rdflib_version, CACHE_FORMAT_VERSION)
+        return os.path.join(self.cache_dir, key + CACHE_EXTENSION)
+
+    def load(self, file_hash):
+        entry_path = self.get_entry_path(file_hash)
+        try:
+            with open(entry_path, 'rb') as f:
+                g = load_graph(f.read())
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        if g is not None:
+            os.utime(entry_path, None)
+        return g
+
+    def store(self, file_hash, g):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_path = self.get_entry_path(file_hash)
+        # Parse workers may store the same entry at the same time.
+        tmp_path = "%s.%d.tmp" % (entry_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(dump_graph(g))
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_EXTENSION):
+                entry_path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # Returns the parsed graph of a file, parsing and caching it on a miss.
+    def parse(self, file_path):
+        file_hash = wikibase_manifest.hash_file(file_path)
+        g = self.load(file_hash)
+        if g is None:
+            g = wikibase_triples.parse_graph(file_path)
+            self.store(file_hash, g)
+        return g
@@ -6,13 +6,14 @@
 #   wikibase_config.py
 #
 
-import ast
 import json
 import os
 import subprocess
+import wikibase_trace
 import yaml
 
 from pathlib import Path
+from wikibase_php import parse_settings
 
 def main():
     #local_settings_dict = get_local_settings()
@@ -23,43 +24,76 @@ def main():
 
     get_sparql_endpoint(yaml_dict)
 
-def get_local_settings():
-    local_settings_path=os.path.join(os.environ['TEMP'], "LocalSettings.php")
+# Parsed LocalSettings.php, reused until the file changes in the container.
+_local_settings_cache = {}
+
+def get_local_settings_path():
+    return os.path.join(os.environ['TEMP'], "LocalSettings.php")
+
+# Returns the modification time and size of LocalSettings.php inside the
+# container, or None if they cannot be read.
+def get_container_local_settings_signature():
+    try:
+        output = subprocess.run('docker exec wbs-deploy-wikibase-1 stat -c "%Y %s" /var/www/html/LocalSettings.php',
+            shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode('utf8').strip()
+    except OSError:
+        return None
+    if len(output.split()) == 2:
+        return output
+    return None
+
+def get_host_file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return "%d %d" % (stat.st_mtime_ns, stat.st_size)
+
+# Returns LocalSettings.php as a flat dict of settings. Nested array keys are
+# indexed too, e.g. "wgWBRepoSettings['string-limits']['VT:string']['length']".
+# The file is only copied out of the container and parsed again when it has
+# changed there (or the host copy has been modified) since the last call.
+def get_local_settings(force=False):
+    local_settings_path=get_local_settings_path()
+    sidecar_path=local_settings_path+".json"
+    container_signature=get_container_local_settings_signature()
+
+    if not force and container_signature:
+        if _local_settings_cache.get("container") == container_signature and _local_settings_cache.get("host") == get_host_file_signature(local_settings_path):
+            return _local_settings_cache["settings"]
+
+        # Reuse a copy fetched by an earlier run if it is still current.
+        if os.path.isfile(sidecar_path):
+            try:
+                with open(sidecar_path, 'r') as f:
+                    sidecar = json.load(f)
+            except ValueError:
+                sidecar = {}
+            if sidecar.get("container") == container_signature and sidecar.get("host") == get_host_file_signature(local_settings_path):
+                return load_local_settings(local_settings_path, container_signature)
+
     subprocess.run("docker cp wbs-deploy-wikibase-1:/var/www/html/LocalSettings.php %s" % local_settings_path, shell=True)
-    local_settings_lines = []
+    local_settings_dict = load_local_settings(local_settings_path, container_signature)
+    if container_signature:
+        with open(sidecar_path, 'w') as f:
+            json.dump({"container": container_signature, "host": _local_settings_cache["host"]}, f)
+    return local_settings_dict
+
+def load_local_settings(local_settings_path, container_signature):
     with open(local_settings_path, 'r') as f:
-        local_settings_lines = f.readlines()
-    local_settings_dict = {}
-    for line in local_settings_lines:
-        if (' = ' in line) and (not line.startswith('#')):
-            if (('[' in line and ']' not in line) or ('array(' in line and ')' not in line)):
-                pass # Not yet implemented.
-            else:
-                stripped_line = line.strip()
-                if '; #' in stripped_line:
-                    stripped_line = stripped_line.split(' #')[0]
-                stripped_line = stripped_line[1:-1]
-                split_line = stripped_line.split(' = ')
-                var_name = split_line[0]
-                if '$' in split_line[1]:
-                    if split_line[1] in local_settings_dict:
-                        var_value = local_settings_dict[split_line[0]]
-                else:
-                    if split_line[1] == "true" or split_line[1] == "false":
-                        var_value = bool(split_line[1])
-                    elif (split_line[1] == "") or (split_line[1] == '') or (split_line[1] == '""') or (split_line[1] == "''"):
-                        var_value = None
-                    elif check_integer(split_line[1]):
-                        var_value = int(split_line[1])
-                    elif ('[' in split_line[1]) and (']' in split_line[1]):
-                        var_value = ast.literal_eval(split_line[1])
-                    elif ("'" in split_line[1]) or ('"' in split_line[1]):
-                        var_value = ast.literal_eval(split_line[1])
-                    else:
-                        pass
-                local_settings_dict[var_name] = var_value
+        local_settings_dict = parse_settings(f.read())
+    _local_settings_cache["container"] = container_signature
+    _local_settings_cache["host"] = get_host_file_signature(local_settings_path)
+    _local_settings_cache["settings"] = local_settings_dict
     return local_settings_dict
 
+# Returns a setting from the optional 'sync' section of the YAML file.
+def get_sync_setting(yaml_dict, setting, default=None):
+    if yaml_dict and "wikibase" in yaml_dict and "sync" in yaml_dict["wikibase"]:
+        if yaml_dict["wikibase"]["sync"] and setting in yaml_dict["wikibase"]["sync"]:
+            return yaml_dict["wikibase"]["sync"][setting]
+    return default
+
 def get_mw_admin_name(yaml_dict):
     if 'mw_admin_name' in yaml_dict['wikibase']:
         return yaml_dict['wikibase']['mw_admin_name']
@@ -71,7 +105,7 @@ def get_mw_admin_name(yaml_dict):
 
 def get_mw_admin_password(yaml_dict):
     if 'mw_admin_password' in yaml_dict['wikibase']:
-        PASSWORD = yaml_dict['wikibase']['mw_admin_password']
+        return yaml_dict['wikibase']['mw_admin_password']
     else:
         with open("./target/"+yaml_dict['repo']+"/src/scripts/wikibase-release-pipeline/deploy/.env") as env_file:
             for line in env_file:
@@ -127,9 +161,10 @@ def get_sparql_endpoint(yaml_dict):
     return sparql_endpoint_url
 
 # TODO: Only works when initializing, will not overwrite.
+@wikibase_trace.phase
 def set_string_limits(yaml_dict):
     local_settings_dict=get_local_settings()
-    local_settings_path=os.path.join(os.environ['TEMP'], "LocalSettings.php")
+    local_settings_path=get_local_settings_path()
     
     if "string_limits" in yaml_dict["wikibase"]:
         if "wgWBRepoSettings['string-limits']['VT:string']['length']" in local_settings_dict:
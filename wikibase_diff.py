@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_diff.py
+#
+
+import hashlib
+import wikibase_triples
+
+from array import array
+from collections import defaultdict
+from rdflib import BNode
+
+# Width of a triple hash in bytes; hashes are kept in array('Q') columns.
+HASH_BYTES = 8
+
+# Width of a blank node label in bytes.
+BNODE_LABEL_BYTES = 16
+
+def hash_bytes(data, digest_size=HASH_BYTES):
+    return hashlib.blake2b(data, digest_size=digest_size).digest()
+
+def get_term_text(term, bnode_labels):
+    if isinstance(term, BNode):
+        return bnode_labels.get(term, "_:")
+    return term.n3()
+
+# Returns stable labels for the blank nodes of a graph, so that the same
+# structure gets the same labels whichever file it was parsed from. Every blank
+# node starts from the terms around it and is relabelled from its neighbours'
+# labels (as in Weisfeiler-Lehman refinement) until the labels of its
+# connected component stop splitting. Blank nodes that cannot be told apart
+# share a label.
+def label_bnodes(g):
+    edges = defaultdict(list)
+    for s, p, o in g:
+        if isinstance(s, BNode):
+            edges[s].append(("+", p.n3(), o))
+        if isinstance(o, BNode):
+            edges[o].append(("-", p.n3(), s))
+    labels = {}
+    for component in get_bnode_components(edges):
+        current = dict((bnode, b"") for bnode in component)
+        distinct = 1
+        while True:
+            refined = {}
+            for bnode in component:
+                signature = sorted("%s %s %s" % (direction, predicate, current[term].hex() if isinstance(term, BNode) else term.n3())
+                    for direction, predicate, term in edges[bnode])
+                refined[bnode] = hash_bytes(current[bnode] + "\n".join(signature).encode("utf-8"), BNODE_LABEL_BYTES)
+            refined_distinct = len(set(refined.values()))
+            current = refined
+            if refined_distinct <= distinct:
+                break
+            distinct = refined_distinct
+        for bnode, label in current.items():
+            labels[bnode] = "_:b" + label.hex()
+    return labels
+
+# Returns the blank nodes of a graph grouped by the blank nodes they are
+# connected to.
+def get_bnode_components(edges):
+    seen = set()
+    components = []
+    for start in edges:
+        if start in seen:
+            continue
+        seen.add(start)
+        component = []
+        stack = [start]
+        while stack:
+            bnode = stack.pop()
+            component.append(bnode)
+            for _, _, term in edges[bnode]:
+                if isinstance(term, BNode) and term not in seen:
+                    seen.add(term)
+                    stack.append(term)
+        components.append(component)
+    return components
+
+# Returns the hash of a triple's canonical N-Triples line.
+def hash_triple(triple, bnode_labels):
+    return hash_line("%s %s %s ." % tuple(get_term_text(term, bnode_labels) for term in triple))
+
+def hash_line(line):
+    return int.from_bytes(hash_bytes(line.encode("utf-8")), "big")
+
+# Returns the hashes of the triples of a graph in iteration order. For graphs
+# backed by an InternedStore, the text of each term is only built once.
+def hash_graph(g, bnode_labels=None):
+    if bnode_labels is None:
+        bnode_labels = label_bnodes(g)
+    store = wikibase_triples.get_interned_store(g)
+    if store is not None:
+        texts = [get_term_text(term, bnode_labels) for term in store.terms]
+        return array('Q', (hash_line("%s %s %s ." % (texts[s], texts[p], texts[o])) for s, p, o in store.iter_ids()))
+    return array('Q', (hash_triple(triple, bnode_labels) for triple in g))
+
+def sort_hashes(hashes):
+    return array('Q', sorted(set(hashes)))
+
+# Returns the hashes in sorted array a that are not in sorted array b.
+def difference(a, b):
+    missing = array('Q')
+    j = 0
+    n = len(b)
+    for value in a:
+        while j < n and b[j] < value:
+            j += 1
+        if j == n or b[j] != value:
+            missing.append(value)
+    return missing
+
+# Returns the triples of g whose hashes are in the given set. hashes must be
+# the result of hash_graph(g) for the same, unmodified graph.
+def select_triples(g, hashes, wanted):
+    if not wanted:
+        return []
+    return [triple for triple, value in zip(g, hashes) if value in wanted]
+
+# Compares two graphs by their triple hashes. Returns (removed, added) lists
+# of triples: those only in source_graph and those only in target_graph.
+# Only these triples are materialized; blank nodes keep the identity they have
+# in the graph they come from.
+def diff_graphs(source_graph, target_graph):
+    source_hashes = hash_graph(source_graph)
+    target_hashes = hash_graph(target_graph)
+    sorted_source = sort_hashes(source_hashes)
+    sorted_target = sort_hashes(target_hashes)
+    removed = select_triples(source_graph, source_hashes, set(difference(sorted_source, sorted_target)))
+    added = select_triples(target_graph, target_hashes, set(difference(sorted_target, sorted_source)))
+    return removed, added
+
+# Returns the synchronization operations for the removed and added triples:
+# removals first, then additions. addition_type and removal_type are called
+# with the subject, predicate and object of each triple.
+def build_ops(removed, added, addition_type, removal_type):
+    return [removal_type(*triple) for triple in removed] + [addition_type(*triple) for triple in added]
@@ -7,14 +7,17 @@
 #
 
 import argparse
-import internetarchive
+import io
 import os
 import pathlib
+import queue
 import re
 import subprocess
+import threading
 import time
+import wikibase_rebuild
+import wikibase_trace
 import yaml
-import zstandard as zstd
 
 from os import getcwd, path, chdir
 from pathlib import Path
@@ -31,6 +34,7 @@ def main():
     parser.add_argument('-resume', default=False, action='store_true')
     parser.add_argument('-upload', default=False, action='store_true')
     parser.add_argument('-download', default=False, action='store_true')
+    parser.add_argument('-shards', default=1, type=int, help='Number of concurrent importDump.php workers used by -upload.')
     args=parser.parse_args()
 
     # Read in YAML file.
@@ -52,7 +56,7 @@ def main():
         install_wikiteam3()
     elif args.create and args.upload:
         dump_folder = create(yaml_dict["wikibase"]["external_host"], dump_rdf_dir, force=True, exclude_namespaces=[146,640])
-        upload(dump_rdf_dir + dump_folder)
+        upload(dump_rdf_dir + dump_folder, shards=args.shards)
     elif args.create:
         dump_folder = create(yaml_dict["wikibase"]["external_host"], dump_rdf_dir)
         print(dump_folder)
@@ -97,14 +101,12 @@ def resume(domain, dump_folder):
     subprocess.run("wikiteam3dumpgenerator "+domain+" --xml --resume", shell=True)
     chdir(wd)
 
-# Uploads an XML dump into the Wikibase.
-def upload(dump_folder, yaml_dict=None, reindex=True):
+# Uploads an XML dump into the Wikibase. With shards > 1, each dump is split
+# at page boundaries and imported by that many importDump.php processes.
+def upload(dump_folder, yaml_dict=None, reindex=True, shards=1):
     if yaml_dict:
         if "dumps" in yaml_dict["wikibase"]:
-            for dump in yaml_dict["wikibase"]["dumps"]:
-                output_file ="/var/tmp/"+str(os.path.basename(dump))
-                subprocess.run('docker cp %s wbs-deploy-wikibase-1:%s' % (dump, output_file), shell=True)
-                subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/importDump.php < %s"' % (output_file), shell=True)
+            import_dumps(yaml_dict["wikibase"]["dumps"], shards=shards, reindex=False, yaml_dict=yaml_dict)
 
         elif "external_host" in yaml_dict["wikibase"]:
             # If not indicated in YAML, download using the WikiTeam 3 dumpgenerator.
@@ -117,42 +119,179 @@ def upload(dump_folder, yaml_dict=None, reindex=True):
         top_level_xml_list = list(pathlib.Path(dump_folder).glob('*-history.xml'))
 
         if len(top_level_xml_list) > 0:
-            for xml_dump in top_level_xml_list:
-                xml_dump_str = str(xml_dump)
-                output_file ="/var/tmp/"+str(os.path.basename(xml_dump_str))
-                subprocess.run('docker cp %s wbs-deploy-wikibase-1:%s' % (xml_dump_str, output_file), shell=True)
-                subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/importDump.php < %s"' % (output_file), shell=True)
-            if reindex:
-                run_rebuild()
+            import_dumps(top_level_xml_list, shards=shards, reindex=reindex)
         else:
             second_level_xml_list = list(pathlib.Path(dump_folder).rglob('*-history.xml'))
             if len(second_level_xml_list) > 0:
-                for xml_dump in top_level_xml_list:
-                    xml_dump_str = str(xml_dump)
-                    output_file ="/var/tmp/"+str(os.path.basename(xml_dump_str))
-                    subprocess.run('docker cp %s wbs-deploy-wikibase-1:/var/tmp/%s' % (xml_dump_str, output_file), shell=True)
-                    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/importDump.php < %s"' % (output_file), shell=True)
-                if reindex:
-                    run_rebuild()
+                import_dumps(second_level_xml_list, shards=shards, reindex=reindex)
             else:
                 third_level_xml_list = list(pathlib.Path(dump_folder).rglob('*-history.xml.zst'))
                 if len(third_level_xml_list) > 0:
-                    dctx = zstd.ZstdDecompressor()
-                    for zst_dump in third_level_xml_list:
-                        zst_dump_str = str(zst_dump)
-                        zst_dump_str_wo_zst = zst_dump_str.replace('.zst', '')
-                        with open(zst_dump_str, 'rb') as ifh, open(zst_dump_str_wo_zst, 'wb') as ofh:
-                            dctx.copy_stream(ifh, ofh, write_size=65536)
-                        output_file ="/var/tmp/"+str(os.path.basename(zst_dump_str_wo_zst))
-                        subprocess.run('docker cp %s wbs-deploy-wikibase-1:%s' % (zst_dump_str_wo_zst, output_file), shell=True)
-                        subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/importDump.php < %s"' % (output_file), shell=True)
-                        if os.path.isfile(zst_dump_str_wo_zst):
-                            os.remove(zst_dump_str_wo_zst)
+                    import_dumps(third_level_xml_list, shards=shards, reindex=reindex)
 
     # Upload all dumps by default.
     else:
         print("Not yet implemented.")
 
+# Imports each dump, then runs the rebuild (including the id counter fix-up) once.
+# Without reindex, the pages are left marked stale for the next rebuild. The
+# import stops at the first dump whose importDump.php run failed, and the
+# rebuild is then left for later.
+def import_dumps(dump_paths, shards=1, reindex=True, yaml_dict=None):
+    failed = False
+    for dump_path in dump_paths:
+        if shards > 1:
+            returncodes = stream_dump_sharded(str(dump_path), shards)
+        else:
+            returncodes = [stream_dump(str(dump_path))]
+        if any(returncode != 0 for returncode in returncodes):
+            print("Importing %s failed; the remaining dumps were not imported." % dump_path)
+            failed = True
+            break
+    wikibase_rebuild.mark_stale(yaml_dict, wikibase_rebuild.PAGES, wikibase_rebuild.ENTITIES)
+    if reindex and not failed:
+        wikibase_rebuild.run_rebuild(yaml_dict, stale=wikibase_rebuild.ALL_INPUTS)
+
+# Opens a dump for reading, decompressing .zst files on the fly.
+def open_dump(ifh, dump_path):
+    if dump_path.endswith('.zst'):
+        import zstandard as zstd
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(ifh), buffer_size=1024*1024)
+    return ifh
+
+IMPORT_DUMP_COMMAND = 'docker exec -i wbs-deploy-wikibase-1 //bin//bash -c "php /var/www/html/maintenance/importDump.php"'
+
+def open_import_dump_process():
+    return subprocess.Popen(IMPORT_DUMP_COMMAND, shell=True, stdin=subprocess.PIPE)
+
+# Streams an XML dump straight into importDump.php's stdin in the container.
+# Files ending in .zst are decompressed on the fly, so the uncompressed dump
+# is never written to disk on the host or in the container.
+def stream_dump(dump_path, chunk_size=1024*1024):
+    dump_path = str(dump_path)
+    process = open_import_dump_process()
+    bytes_sent = 0
+    start = time.perf_counter()
+    with open(dump_path, 'rb') as ifh:
+        reader = open_dump(ifh, dump_path)
+        try:
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    break
+                process.stdin.write(chunk)
+                bytes_sent += len(chunk)
+        except BrokenPipeError:
+            print("importDump.php exited before %s was fully sent." % dump_path)
+    try:
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    returncode = process.wait()
+    wikibase_trace.record_command(IMPORT_DUMP_COMMAND, start, returncode)
+    report_import(dump_path, bytes_sent, time.perf_counter() - start, [returncode])
+    return returncode
+
+def report_import(dump_path, bytes_sent, elapsed, returncodes):
+    file_mb = os.path.getsize(dump_path) / 1e6
+    sent_mb = bytes_sent / 1e6
+    print("Imported %s: %.1f MB read, %.1f MB streamed in %.1fs (%.1f MB/s), exit code(s) %s." % (
+        os.path.basename(dump_path), file_mb, sent_mb, elapsed, sent_mb / elapsed if elapsed > 0 else 0.0,
+        ", ".join(str(returncode) for returncode in returncodes)))
+
+# Yields the header (everything before the first <page>) followed by each
+# <page>...</page> element of an XML dump as bytes, reading line by line.
+def iter_dump_pages(reader):
+    header = []
+    page = None
+    in_header = True
+    for line in reader:
+        stripped = line.strip()
+        if stripped == b'<page>':
+            if in_header:
+                yield b''.join(header)
+                in_header = False
+            page = [line]
+        elif page is not None:
+            page.append(line)
+            if stripped == b'</page>':
+                yield b''.join(page)
+                page = None
+        elif in_header:
+            header.append(line)
+    if in_header:
+        yield b''.join(header)
+
+# Feeds one importDump.php process from a bounded queue of pages. If the
+# process exits early, failed is set so that the splitter stops.
+def feed_import_worker(process, pages, footer, failed):
+    try:
+        while True:
+            page = pages.get()
+            if page is None:
+                break
+            process.stdin.write(page)
+        process.stdin.write(footer)
+    except BrokenPipeError:
+        failed.set()
+        # Keep draining so the splitter is never blocked by a dead worker.
+        while pages.get() is not None:
+            pass
+    try:
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+
+# Splits an XML dump at page boundaries while streaming it and imports the
+# pages with several concurrent importDump.php processes. Each page goes to
+# the worker with the shortest queue; every worker gets the same
+# <mediawiki>/<siteinfo> header so that each stream is a valid dump. If a
+# worker exits early, the split stops and the other workers are closed. A
+# worker that stopped reading its pages counts as failed (exit code 1) even
+# if it exited with 0. Returns the exit codes of the workers.
+def stream_dump_sharded(dump_path, shards, queue_size=64):
+    dump_path = str(dump_path)
+    footer = b'</mediawiki>\n'
+    processes = []
+    queues = []
+    feeders = []
+    failed = []
+    bytes_sent = 0
+    start = time.perf_counter()
+    try:
+        with open(dump_path, 'rb') as ifh:
+            pages = iter_dump_pages(open_dump(ifh, dump_path))
+            header = next(pages)
+            bytes_sent += len(header) + len(footer)
+            for _ in range(shards):
+                process = open_import_dump_process()
+                page_queue = queue.Queue(maxsize=queue_size)
+                page_queue.put(header)
+                worker_failed = threading.Event()
+                feeder = threading.Thread(target=feed_import_worker, args=(process, page_queue, footer, worker_failed), daemon=True)
+                feeder.start()
+                processes.append(process)
+                queues.append(page_queue)
+                feeders.append(feeder)
+                failed.append(worker_failed)
+            for page in pages:
+                if any(worker_failed.is_set() for worker_failed in failed):
+                    print("An importDump.php worker exited before %s was fully sent; stopping." % dump_path)
+                    break
+                min(queues, key=lambda q: q.qsize()).put(page)
+                bytes_sent += len(page)
+    finally:
+        # Always end the feeders, even if reading the dump failed.
+        for page_queue in queues:
+            page_queue.put(None)
+        for feeder in feeders:
+            feeder.join()
+    returncodes = [process.wait() or (1 if worker_failed.is_set() else 0) for process, worker_failed in zip(processes, failed)]
+    for returncode in returncodes:
+        wikibase_trace.record_command(IMPORT_DUMP_COMMAND, start, returncode)
+    report_import(dump_path, bytes_sent, time.perf_counter() - start, returncodes)
+    return returncodes
+
 # Downloads RDF dump from existing Wikibase.
 def download(yaml_dict):
     time_now=str(int(time.time()))
@@ -171,17 +310,6 @@ def download(yaml_dict):
     subprocess.run('docker cp wbs-deploy-wikibase-1:%s ./target/%s/src/ontology/tmp/dumps/dumpRdf.php/%s' % (wikibase_dump_path, yaml_dict["repo"], wikibase_dump_file), shell=True)
     return wikibase_dump_file
 
-# Rebuild Wikibase instance.
-def run_rebuild():
-    # Send over rebuild script.
-    subprocess.run("docker cp wikibase_rebuild.sh wbs-deploy-wikibase-1:/var/tmp/wikibase_rebuild.sh", shell=True)
-
-    # Run rebuild script.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "/var/tmp/wikibase_rebuild.sh"', shell=True)
-
-    # Remove rebuild script.
-    subprocess.run('docker exec wbs-deploy-wikibase-1 //bin//bash -c "rm /var/tmp/wikibase_rebuild.sh"', shell=True)
-
 def get_dump_path(domain, output, dump_folder, resume=False):
     url = urlparse(domain)
     host_name = str(url.hostname)
@@ -218,6 +346,7 @@ def get_dump_path(domain, output, dump_folder, resume=False):
             return "wiki-" + folder_name
         else:
             chdir(dump_folder)
+            import internetarchive
             internetarchive.download('wiki-'+folder_name, verbose=True)
             return "wiki-" + folder_name
     else:
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_executor.py
+#
+
+import contextlib
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from rdflib import BNode, Literal, URIRef
+from wikibase_failures import AMBIGUOUS, NO_RETRY, classify_error
+from wikibase_index import TypeIndex
+
+# Operation types (by class name, as in dead-letter files) whose writes must
+# not be retried blindly.
+NON_IDEMPOTENT_OPS = frozenset(["AdditionOperation"])
+
+# Returns the rdflib term of a wbsync triple element (URIElement,
+# AnonymousElement or LiteralElement).
+def get_element_term(element):
+    if element.is_literal():
+        # Literals whose lexical form rdflib could not convert have no content.
+        content = "" if element.content is None else element.content
+        return Literal(content, datatype=element.datatype, lang=element.lang)
+    if element.is_blank():
+        return BNode(element.uid)
+    return URIRef(element.uri)
+
+# Returns the (subject, predicate, object) wbsync elements of a
+# synchronization operation. These are what the adapter and the URI factory
+# work with.
+def get_op_elements(op):
+    return op._triple_info.content
+
+# Returns the (subject, predicate, object) triple of a synchronization
+# operation as rdflib terms.
+def get_op_triple(op):
+    return tuple(get_element_term(element) for element in get_op_elements(op))
+
+# Returns the subject of a synchronization operation as an rdflib term.
+def get_op_subject(op):
+    return get_element_term(get_op_elements(op)[0])
+
+# Groups operations by subject, keeping both the order of first appearance of
+# each subject and the order of the operations within each subject.
+def group_ops_by_subject(ops):
+    groups = OrderedDict()
+    for op in ops:
+        subject = get_op_subject(op)
+        if subject not in groups:
+            groups[subject] = []
+        groups[subject].append(op)
+    return list(groups.values())
+
+# Subjects are created in this order, so that the properties and classes
+# that later statements refer to already exist.
+RANK_PROPERTY = 0
+RANK_CLASS = 1
+RANK_INSTANCE = 2
+RANK_OTHER = 3
+
+def get_subject_rank(subject, type_index):
+    if type_index.is_property(subject):
+        return RANK_PROPERTY
+    if type_index.is_class(subject):
+        return RANK_CLASS
+    if type_index.is_instance(subject):
+        return RANK_INSTANCE
+    return RANK_OTHER
+
+# Orders subject groups into levels that can each run in parallel. Groups are
+# ranked as properties, then classes, then instances, then everything else,
+# using the rdf:type triples among the operations (and those of type_index,
+# e.g. the index of the whole file, if given). Within a rank, a group
+# waits for the groups whose subjects it refers to (as predicate or object),
+# levelled with Kahn's algorithm; groups caught in a cycle share the last
+# level of their rank.
+def schedule_groups(groups, type_index=None):
+    op_index = TypeIndex().add_triples(get_op_triple(op) for group in groups for op in group)
+    type_index = op_index.update(type_index) if type_index is not None else op_index
+    ranks = OrderedDict()
+    for group in groups:
+        ranks.setdefault(get_subject_rank(get_op_subject(group[0]), type_index), []).append(group)
+    levels = []
+    for rank in sorted(ranks):
+        rank_groups = ranks[rank]
+        index_of = dict((get_op_subject(group[0]), i) for i, group in enumerate(rank_groups))
+        dependents = [[] for _ in rank_groups]
+        in_degree = [0] * len(rank_groups)
+        for i, group in enumerate(rank_groups):
+            dependencies = set()
+            for op in group:
+                for term in get_op_triple(op)[1:]:
+                    j = index_of.get(term) if isinstance(term, URIRef) else None
+                    if j is not None and j != i:
+                        dependencies.add(j)
+            for j in dependencies:
+                dependents[j].append(i)
+            in_degree[i] = len(dependencies)
+        ready = [i for i in range(len(rank_groups)) if in_degree[i] == 0]
+        scheduled = 0
+        while ready:
+            levels.append([rank_groups[i] for i in ready])
+            scheduled += len(ready)
+            next_ready = []
+            for i in ready:
+                for k in dependents[i]:
+                    in_degree[k] -= 1
+                    if in_degree[k] == 0:
+                        next_ready.append(k)
+            ready = next_ready
+        if scheduled < len(rank_groups):
+            levels.append([rank_groups[i] for i in range(len(rank_groups)) if in_degree[i] > 0])
+    return levels
+
+# Serializes the operations that may create entities. The adapter creates an
+# entity the first time it meets a URI with no mapping, so two workers that
+# both miss the mapping of a shared property or class would create it twice.
+# Only the subject can create an entity when the predicate is one of
+# term_predicates (the value becomes a label, description or alias); otherwise
+# the predicate and a URI or blank node object can as well. Operations with
+# such an element is_known() does not know yet run under one lock (and see the
+# mapping once the first of them has created it); other operations run
+# concurrently.
+class CreationGuard:
+
+    def __init__(self, is_known, term_predicates=frozenset()):
+        self.is_known = is_known
+        self.term_predicates = term_predicates
+        self._lock = threading.Lock()
+
+    def may_create(self, op):
+        subject, predicate, obj = get_op_elements(op)
+        elements = [subject]
+        if get_element_term(predicate) not in self.term_predicates:
+            elements += [predicate, obj]
+        return any(not element.is_literal() and not self.is_known(element) for element in elements)
+
+    def hold(self, op):
+        if self.may_create(op):
+            return self._lock
+        return contextlib.nullcontext()
+
+# Collects counts and latencies while operations are being executed.
+class ExecutionStats:
+
+    def __init__(self):
+        self.total = 0
+        self.failures = 0
+        self.retries = 0
+        self.latencies = []
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency, successful):
+        with self._lock:
+            self.total += 1
+            self.latencies.append(latency)
+            if not successful:
+                self.failures += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def merge(self, other):
+        with self._lock:
+            self.total += other.total
+            self.failures += other.failures
+            self.retries += other.retries
+            self.latencies.extend(other.latencies)
+            self.elapsed += other.elapsed
+
+    # Returns the number of operations that succeeded.
+    def applied(self):
+        return self.total - self.failures
+
+    def ops_per_second(self):
+        if self.elapsed > 0:
+            return self.total / self.elapsed
+        return 0.0
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = int(round((pct / 100.0) * (len(ordered) - 1)))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            "ops": self.total,
+            "failures": self.failures,
+            "retries": self.retries,
+            "elapsed_s": round(self.elapsed, 3),
+            "ops_per_s": round(self.ops_per_second(), 2),
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+            "max_ms": round(max(self.latencies) * 1000, 1) if self.latencies else 0.0
+        }
+
+    def report(self, label="Synchronization"):
+        summary = self.summary()
+        print("%s finished: %d ops in %.1fs (%.2f ops/s), %d failed, %d retries; latency p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms." % (
+            label, summary["ops"], summary["elapsed_s"], summary["ops_per_s"], summary["failures"], summary["retries"],
+            summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], summary["max_ms"]))
+
+# Executes a single operation against the adapter; returns True on success.
+# Transient failures (maxlag, 5xx, timeouts) are retried according to the
+# retry policy; permanent failures, and transient ones that ran out of
+# retries, are written to the dead-letter file if one is given.
+def execute_op(op, adapter, verbose=True, retry_policy=NO_RETRY, dead_letters=None, stats=None):
+    if verbose:
+        print(op)
+    attempt = 0
+    while True:
+        attempt += 1
+        error = None
+        try:
+            res = op.execute(adapter)
+            if res.successful:
+                return True
+            message = res.message
+        except Exception as e:
+            error = e
+            message = "%s: %s" % (type(e).__name__, e)
+        kind = classify_error(error, message, is_idempotent(op))
+        if retry_policy.should_retry(kind, attempt):
+            delay = retry_policy.get_delay(attempt)
+            if stats is not None:
+                stats.record_retry()
+            print("Transient error synchronizing triple (attempt %d of %d), retrying in %.1fs: %s" % (
+                attempt, retry_policy.max_attempts, delay, message))
+            time.sleep(delay)
+            continue
+        print(f"Error synchronizing triple ({kind}): {message}")
+        if kind == AMBIGUOUS:
+            print("The triple may have been written; check it before replaying.")
+        if dead_letters is not None:
+            dead_letters.write(op, message, kind, attempt)
+        return False
+
+# Returns True if executing an operation twice has the same effect as once.
+# Additions are not: a retried addition can add a duplicate statement.
+def is_idempotent(op):
+    return type(op).__name__ not in NON_IDEMPOTENT_OPS
+
+# Executes one operation and records it in the stats and, if successful, in
+# the journal. With a creation guard, operations that may create entities run
+# one at a time.
+def execute_and_record(op, adapter, stats, verbose=True, journal=None, retry_policy=NO_RETRY, dead_letters=None, guard=None):
+    start = time.perf_counter()
+    with guard.hold(op) if guard is not None else contextlib.nullcontext():
+        successful = execute_op(op, adapter, verbose, retry_policy, dead_letters, stats)
+    stats.record(time.perf_counter() - start, successful)
+    if successful and journal is not None:
+        journal.record(op)
+    return successful
+
+# Executes the operations of one subject in order, recording the successful
+# ones in the journal if one is given. With a batcher, runs of additions are
+# written as one entity edit; see wikibase_batch.EntityBatcher.
+def execute_group(group, adapter, stats, verbose=True, journal=None, retry_policy=NO_RETRY, dead_letters=None, batcher=None, guard=None):
+    args = (adapter, stats, verbose, journal, retry_policy, dead_letters, guard)
+    if batcher is None:
+        for op in group:
+            execute_and_record(op, *args)
+        return
+    for step in batcher.plan(group):
+        if not isinstance(step, list):
+            execute_and_record(step, *args)
+            continue
+        ops = step
+        subject = get_op_subject(ops[0])
+        entity_id = batcher.resolve_entity_id(subject)
+        if entity_id is None:
+            # Let the adapter create the entity with the first triple.
+            execute_and_record(ops[0], *args)
+            ops = ops[1:]
+            entity_id = batcher.resolve_entity_id(subject)
+        if entity_id is not None and len(ops) > 1:
+            start = time.perf_counter()
+            batched, ops, uncertain = batcher.write_batch(entity_id, ops, retry_policy)
+            for op in uncertain:
+                # Not applied one by one either, which could duplicate them.
+                stats.record(0.0, False)
+                if dead_letters is not None:
+                    dead_letters.write(op, "batched edit of %s may have been applied" % entity_id, AMBIGUOUS, 1)
+            if batched:
+                latency = (time.perf_counter() - start) / len(batched)
+                for op in batched:
+                    if verbose:
+                        print(op)
+                    stats.record(latency, True)
+                    if journal is not None:
+                        journal.record(op)
+        for op in ops:
+            execute_and_record(op, *args)
+
+# Executes operations with a bounded pool of workers. Operations on different
+# subjects run in parallel; operations on the same subject keep their order.
+# With ordered, subjects run level by level as planned by schedule_groups.
+# With a journal, operations it already lists are skipped. Running more than
+# one worker needs a creation guard (see CreationGuard); without one, the
+# operations run one at a time.
+def execute_ops(ops, adapter, concurrency=1, stats=None, verbose=True, journal=None, retry_policy=NO_RETRY, dead_letters=None, batcher=None, ordered=False, type_index=None, guard=None):
+    if stats is None:
+        stats = ExecutionStats()
+    if journal is not None:
+        ops = journal.pending(ops)
+    groups = group_ops_by_subject(ops)
+    levels = schedule_groups(groups, type_index) if ordered else [groups]
+    args = (adapter, stats, verbose, journal, retry_policy, dead_letters, batcher, guard)
+    start = time.perf_counter()
+    if concurrency <= 1 or len(groups) <= 1 or guard is None:
+        for level in levels:
+            for group in level:
+                execute_group(group, *args)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for level in levels:
+                futures = [pool.submit(execute_group, group, *args) for group in level]
+                for future in futures:
+                    future.result()
+    stats.elapsed += time.perf_counter() - start
+    return stats
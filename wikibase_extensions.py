@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_extensions.py
+#
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wikibase_trace
+
+from concurrent.futures import ThreadPoolExecutor
+from wikibase_session import WIKIBASE_CONTAINER, CommandSession
+
+EXTENSION_BRANCH = "REL1_41"
+EXTENSION_URL = "https://gerrit.wikimedia.org/r/p/mediawiki/extensions/%s.git"
+CONTAINER_EXTENSIONS_DIR = "/var/www/html/extensions"
+
+MIRROR_DIR = "wikiodk-extension-mirrors"
+
+# Returns the directory of the bare mirror of one branch of an extension,
+# kept under TEMP so that it survives between projects on the same host.
+def get_mirror_path(extension, branch=EXTENSION_BRANCH):
+    temp_dir = os.environ.get('TEMP') or tempfile.gettempdir()
+    return os.path.join(temp_dir, MIRROR_DIR, "%s@%s.git" % (extension, branch))
+
+# Returns the extensions that are already in the container, checking all of
+# them with one command.
+def get_existing_extensions(extensions, container=WIKIBASE_CONTAINER):
+    if not extensions:
+        return set()
+    with CommandSession(container, echo=False) as session:
+        result = session.run("for e in %s; do test -d %s/$e && echo $e; done; true" % (" ".join(extensions), CONTAINER_EXTENSIONS_DIR))
+    return set(line.strip() for line in result.output.splitlines()) & set(extensions)
+
+# Creates or updates the mirror of an extension branch. Returns the mirror
+# path, or None if there is no usable mirror.
+def fetch_mirror(extension, branch=EXTENSION_BRANCH):
+    mirror_path = get_mirror_path(extension, branch)
+    if os.path.isdir(mirror_path):
+        # A bare clone has no remote-tracking refspec that updates its branches,
+        # so the branch is fetched into itself explicitly.
+        result = subprocess.run(["git", "--git-dir", mirror_path, "fetch", "--prune", "--quiet", "origin",
+            "+refs/heads/%s:refs/heads/%s" % (branch, branch)])
+        if result.returncode != 0:
+            print("Could not update the mirror of %s; using the cached copy." % extension)
+        return mirror_path
+    os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+    return clone_mirror(extension, mirror_path, branch)
+
+# Clones one branch of an extension into a bare mirror at mirror_path. Returns
+# the path, or None if the clone failed.
+def clone_mirror(extension, mirror_path, branch=EXTENSION_BRANCH):
+    # Clone next to the final path and move it in place, so that an interrupted
+    # clone is never taken for a mirror.
+    tmp_path = "%s.%d.%d.tmp" % (mirror_path, os.getpid(), threading.get_ident())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    result = subprocess.run(["git", "clone", "--bare", "--single-branch", "--quiet", "-b", branch, EXTENSION_URL % extension, tmp_path])
+    if result.returncode != 0:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return None
+    os.replace(tmp_path, mirror_path)
+    return mirror_path
+
+# Streams the branch of a mirror into the container's extensions directory
+# (git archive | tar -x), without a working copy on the host. Returns True on
+# success.
+def copy_extension(extension, mirror_path, branch=EXTENSION_BRANCH, container=WIKIBASE_CONTAINER):
+    archive_command = ["git", "--git-dir", mirror_path, "archive", "--format=tar", "--prefix=%s/" % extension, branch]
+    start = time.perf_counter()
+    archive = subprocess.Popen(archive_command, stdout=subprocess.PIPE)
+    extract = subprocess.run(["docker", "exec", "-i", container, "tar", "-x", "--no-same-owner", "-C", CONTAINER_EXTENSIONS_DIR],
+        stdin=archive.stdout)
+    archive.stdout.close()
+    archive_returncode = archive.wait()
+    wikibase_trace.record_command(archive_command, start, archive_returncode)
+    return archive_returncode == 0 and extract.returncode == 0
+
+# Fetches one extension and copies it into the container. Returns None on
+# success or a message saying what failed. Without persist_on_host, the
+# extension is fetched into a mirror of this run only, which is removed
+# afterwards; the shared mirror other projects may be using is left alone.
+def install_extension(extension, branch=EXTENSION_BRANCH, persist_on_host=True, container=WIKIBASE_CONTAINER):
+    with wikibase_trace.trace_phase("extension:%s" % extension):
+        if persist_on_host:
+            return install_from_mirror(extension, fetch_mirror(extension, branch), branch, container)
+        run_dir = tempfile.mkdtemp(prefix="wikiodk-extension-")
+        try:
+            return install_from_mirror(extension, clone_mirror(extension, os.path.join(run_dir, "mirror.git"), branch), branch, container)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+def install_from_mirror(extension, mirror_path, branch=EXTENSION_BRANCH, container=WIKIBASE_CONTAINER):
+    if mirror_path is None:
+        return "could not clone %s" % (EXTENSION_URL % extension)
+    if not copy_extension(extension, mirror_path, branch, container):
+        return "could not copy it into %s" % container
+    return None
+
+# Installs the extensions that are not in the container yet, fetching and
+# copying them concurrently. Returns {extension: message} for those that
+# failed.
+@wikibase_trace.phase
+def install_missing_extensions(extensions, branch=EXTENSION_BRANCH, persist_on_host=True, container=WIKIBASE_CONTAINER, max_workers=4):
+    existing = get_existing_extensions(extensions, container)
+    missing = [extension for extension in extensions if extension not in existing]
+    if existing:
+        print("Already installed: %s" % ", ".join(sorted(existing)))
+    if not missing:
+        return {}
+    print("Installing %s from %s..." % (", ".join(missing), branch))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+        messages = list(pool.map(lambda extension: install_extension(extension, branch, persist_on_host, container), missing))
+    failed = dict((extension, message) for extension, message in zip(missing, messages) if message)
+    for extension, message in failed.items():
+        print("Failed to install %s: %s" % (extension, message))
+    return failed
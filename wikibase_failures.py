@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_failures.py
+#
+
+import json
+import os
+import random
+import re
+import threading
+import time
+import wikibase_executor
+
+from rdflib.util import from_n3
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+# A write whose request may have reached the server before it failed; it is
+# not retried, since it may have been applied already.
+AMBIGUOUS = "ambiguous"
+
+DEAD_LETTER_FILE = "dead_letters.jsonl"
+
+# API error codes and messages that mean "try again later": replication lag,
+# rate limits, read-only mode, server errors and timeouts.
+TRANSIENT_PATTERN = re.compile(
+    r"maxlag|ratelimited|too many requests|readonly|read-only|"
+    r"timed? ?out|timeout|connection (?:aborted|reset|refused)|temporarily unavailable|"
+    r"internal_api_error|bad gateway|service unavailable|gateway time|"
+    r"\b(?:429|500|502|503|504)\b",
+    re.I)
+
+# Exception type names treated as transient wherever they come from (requests,
+# urllib3, the standard library).
+TRANSIENT_EXCEPTIONS = frozenset([
+    "Timeout", "ConnectTimeout", "ReadTimeout", "TimeoutError", "timeout",
+    "ConnectionError", "ConnectionResetError", "ConnectionAbortedError", "ConnectionRefusedError",
+    "ChunkedEncodingError", "ProtocolError", "RemoteDisconnected", "MaxRetryError"
+])
+
+# Exception type names that can be raised after a request was sent, so that
+# it is unknown whether the server applied it.
+AMBIGUOUS_EXCEPTIONS = frozenset([
+    "ReadTimeout", "TimeoutError", "timeout",
+    "ConnectionResetError", "ConnectionAbortedError",
+    "ChunkedEncodingError", "ProtocolError", "RemoteDisconnected"
+])
+
+# Exception type names raised before a request was sent.
+UNSENT_EXCEPTIONS = frozenset([
+    "ConnectTimeout", "ConnectionRefusedError", "NewConnectionError"
+])
+
+TIMEOUT_PATTERN = re.compile(r"timed? ?out|timeout", re.I)
+
+# Returns TRANSIENT or PERMANENT for a failed operation, from the exception
+# it raised and/or the message of an unsuccessful result. Unsupported
+# operations (ValueError, NotImplementedError) are always permanent. For
+# writes that are not idempotent, exceptions raised while waiting for the
+# response (such as read timeouts) are AMBIGUOUS rather than transient.
+def classify_error(error=None, message=None, idempotent=True):
+    if isinstance(error, (ValueError, NotImplementedError)):
+        return PERMANENT
+    if error is not None:
+        if not idempotent and type(error).__name__ not in UNSENT_EXCEPTIONS and (
+                type(error).__name__ in AMBIGUOUS_EXCEPTIONS or TIMEOUT_PATTERN.search(str(error))):
+            return AMBIGUOUS
+        if type(error).__name__ in TRANSIENT_EXCEPTIONS:
+            return TRANSIENT
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+        if status_code is not None and (status_code >= 500 or status_code == 429):
+            return TRANSIENT
+        if message is None:
+            message = str(error)
+    if message and TRANSIENT_PATTERN.search(str(message)):
+        return TRANSIENT
+    return PERMANENT
+
+# How often and how long to wait before retrying transient failures:
+# exponential backoff with full jitter, capped at max_delay.
+class RetryPolicy:
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        return kind == TRANSIENT and attempt < self.max_attempts
+
+    # Seconds to wait after the given (1-based) failed attempt.
+    def get_delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+# Never retries.
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+def get_retry_policy(yaml_dict):
+    sync_dict = (yaml_dict or {}).get("wikibase", {}).get("sync") or {}
+    return RetryPolicy(
+        max_attempts=sync_dict.get("retry_attempts") or 5,
+        base_delay=sync_dict.get("retry_base_delay") or 1.0,
+        max_delay=sync_dict.get("retry_max_delay") or 60.0)
+
+def get_dead_letter_path(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), DEAD_LETTER_FILE)
+
+# Returns the serialized form of an operation: its type, the N3 form of the
+# terms its wbsync elements stand for (which rdflib.util.from_n3 turns back
+# into terms) and the annotations of its URI elements, see annotate_op.
+def serialize_op(op):
+    subject, predicate, obj = wikibase_executor.get_op_triple(op)
+    return {
+        "type": type(op).__name__,
+        "subject": subject.n3(),
+        "predicate": predicate.n3(),
+        "object": obj.n3(),
+        "annotations": [get_element_annotation(element) for element in wikibase_executor.get_op_elements(op)]
+    }
+
+# Returns the entity type and property datatype the synchronizer annotated a
+# URI element with, or None for blank nodes and literals.
+def get_element_annotation(element):
+    if element.is_uri():
+        return [element.etype, element.proptype]
+    return None
+
+# Restores the annotations serialize_op saved onto the elements of an
+# operation rebuilt from its terms.
+def annotate_op(op, annotations):
+    for element, annotation in zip(wikibase_executor.get_op_elements(op), annotations or ()):
+        if annotation and element.is_uri():
+            element.etype, element.proptype = annotation
+    return op
+
+def get_entry_key(entry):
+    return (entry["type"], entry["subject"], entry["predicate"], entry["object"])
+
+# Append-only JSON Lines file of operations that failed permanently (or ran
+# out of retries), with the error, so they can be replayed on their own.
+class DeadLetterFile:
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def write(self, op, message, kind, attempts):
+        entry = serialize_op(op)
+        entry.update({"error": str(message), "kind": kind, "attempts": attempts, "time": round(time.time(), 3)})
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            self.count += 1
+
+# Returns the entries of a dead-letter file, one per distinct operation (the
+# latest wins), with a "terms" tuple of parsed (subject, predicate, object).
+def load_dead_letters(path):
+    entries = {}
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    key = get_entry_key(entry)
+                except (ValueError, KeyError):
+                    continue
+                entries.pop(key, None)
+                entries[key] = entry
+    for entry in entries.values():
+        entry["terms"] = (from_n3(entry["subject"]), from_n3(entry["predicate"]), from_n3(entry["object"]))
+    return list(entries.values())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_health.py
+#
+
+import json
+import subprocess
+import time
+
+# Returns the state of every container in one 'docker inspect' call, as a
+# dict of name to {'status', 'health', 'healthy'}. Containers that do not
+# exist are reported with status 'missing'.
+def snapshot_containers(container_names):
+    snapshot = {}
+    for container_name in container_names:
+        snapshot[container_name] = {"status": "missing", "health": None, "healthy": False}
+    try:
+        output = subprocess.run("docker inspect %s" % " ".join(container_names), shell=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+        inspected = json.loads(output.decode('utf-8')) if output.strip() else []
+    except (OSError, ValueError):
+        inspected = []
+    for container in inspected:
+        container_name = container.get("Name", "").lstrip("/")
+        if container_name not in snapshot:
+            continue
+        state = container.get("State") or {}
+        status = state.get("Status", "unknown")
+        health = (state.get("Health") or {}).get("Status")
+        snapshot[container_name] = {
+            "status": status,
+            "health": health,
+            # Containers without a health check count as healthy once running.
+            "healthy": status == "running" and health in (None, "healthy")
+        }
+    return snapshot
+
+# Returns True if every container of a snapshot is healthy.
+def all_healthy(snapshot):
+    return all(state["healthy"] for state in snapshot.values())
+
+# Polls the containers with exponential backoff until all are healthy or the
+# timeout passes. Returns (snapshot, time_to_healthy), where snapshot is the
+# last state seen and time_to_healthy maps each container that became
+# healthy at some point to the seconds it took, measured from started_at
+# (defaults to now). A container can have become healthy and exited since,
+# so the snapshot is what tells whether they are all healthy now.
+def wait_for_containers(container_names, timeout=600, started_at=None, initial_delay=1.0, max_delay=15.0):
+    if started_at is None:
+        started_at = time.monotonic()
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    time_to_healthy = {}
+    while True:
+        snapshot = snapshot_containers(container_names)
+        elapsed = time.monotonic() - started_at
+        for container_name, state in snapshot.items():
+            if state["healthy"] and container_name not in time_to_healthy:
+                time_to_healthy[container_name] = elapsed
+        if all_healthy(snapshot):
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+    report_health(snapshot, time_to_healthy)
+    return snapshot, time_to_healthy
+
+# Prints the state and time-to-healthy of each container.
+def report_health(snapshot, time_to_healthy):
+    for container_name, state in snapshot.items():
+        if state["healthy"] and container_name in time_to_healthy:
+            timing = "healthy after %.1fs" % time_to_healthy[container_name]
+        else:
+            timing = "NOT HEALTHY"
+        print("%-35s %-10s %-10s %s" % (container_name, state["status"], state["health"] or "-", timing))
@@ -8,161 +8,451 @@
 
 import argparse
 import contextlib
+import os
 import os.path
 import rdflib
 import requests
-import sys
+import threading
 import warnings
 import wbsync.triplestore.wikibase_adapter
+import wikibase_batch
+import wikibase_cache
 import wikibase_config
+import wikibase_diff
+import wikibase_executor
+import wikibase_failures
+import wikibase_journal
+import wikibase_manifest
+import wikibase_stream
+import wikibase_trace
+import wikibase_triples
+import wikibase_uri_store
+import wikibase_wqs
 import yaml
 
-from os import getcwd, path
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from rdflib.namespace import OWL, RDF, RDFS
 from urllib3.exceptions import InsecureRequestWarning
 
 from wbsync.external.uri_factory import URIFactoryMock
-from wbsync.triplestore import WikibaseAdapter
-from wbsync.synchronization import GraphDiffSyncAlgorithm, OntologySynchronizer
-from wikibase_config import get_api_endpoint, get_sparql_endpoint
-from wikidataintegrator.wdi_config import config as wikidata_integrator_config
+from wbsync.triplestore import TripleElement, TripleInfo, WikibaseAdapter
+from wbsync.synchronization import AdditionOperation, GraphDiffSyncAlgorithm, OntologySynchronizer, RemovalOperation
+from wbsync.synchronization.ontology_synchronizer import _filter_invalid_ops as filter_invalid_ops
+from wikibase_config import get_api_endpoint, get_sparql_endpoint, get_sync_setting
+from wikibase_index import TypeIndex
+from wikidataintegrator import wdi_core
 
 old_merge_environment_settings = requests.Session.merge_environment_settings
 
+graph_cache = None
+uri_store = None
+# Logged-in sessions for batched edits, keyed by API endpoint, so that an
+# import logs in once rather than once per file or chunk.
+batch_sessions = {}
+
 def main():
 
     parser=argparse.ArgumentParser()
     parser.add_argument('--source', type=str, required=False, help='The source file name.')
     parser.add_argument('--target', type=str, required=False, help='The target file name.')
+    parser.add_argument('--stream', default=False, action='store_true', help='Synchronize large files in subject-grouped chunks.')
+    parser.add_argument('--no_cache', default=False, action='store_true', help='Parse files without using the parsed-graph cache.')
+    parser.add_argument('--clear_cache', default=False, action='store_true', help='Remove all cached parsed graphs before running.')
+    parser.add_argument('--resume', '-resume', default=False, action='store_true', help='Skip operations an interrupted import already applied.')
+    parser.add_argument('--replay', nargs='?', const='', default=None, help='Only replay a dead-letter file (default: the project\'s).')
     args=parser.parse_args()
 
     # Read in YAML file.
     yaml_dict=yaml.safe_load(Path("project.yaml").read_text())
     print(yaml_dict)
 
+    if args.stream:
+        if not yaml_dict["wikibase"].get("sync"):
+            yaml_dict["wikibase"]["sync"] = {}
+        yaml_dict["wikibase"]["sync"]["stream"] = True
+
+    if args.resume:
+        if not yaml_dict["wikibase"].get("sync"):
+            yaml_dict["wikibase"]["sync"] = {}
+        yaml_dict["wikibase"]["sync"]["resume"] = True
+
+    if args.clear_cache:
+        wikibase_cache.clear_cache(yaml_dict)
+    init_graph_cache(yaml_dict, enabled=not args.no_cache)
+
     init_factory(yaml_dict)
 
-    if args.source and args.target:
+    if args.replay is not None:
+        replay_dead_letters(yaml_dict, args.replay or None)
+    elif args.source and args.target:
         update_from_file(yaml_dict, args.target, args.source)
     else:
         import_from_file(yaml_dict)
 
+@wikibase_trace.phase
 def parse_file(file_path):
     if os.path.isfile(file_path):
-        g = rdflib.Graph()
-        g.parse(file_path)
-        return g
+        if graph_cache:
+            return graph_cache.parse(file_path)
+        return wikibase_triples.parse_graph(file_path)
     else:
         exit()
 
+# Sets up the on-disk cache of parsed graphs. It is read by parse_file (for
+# update_from_file) and by the workers of parse_import_files (for imports),
+# which open the same directory from the arguments they are given.
+def init_graph_cache(yaml_dict, enabled=True):
+    global graph_cache
+    max_mb = get_sync_setting(yaml_dict, "graph_cache_mb", 512)
+    if enabled and max_mb:
+        graph_cache = wikibase_cache.GraphCache(wikibase_cache.get_cache_dir(yaml_dict), max_mb * 1024 * 1024)
+    else:
+        graph_cache = None
+    return graph_cache
+
 def return_properties(g):
-    properties = []
-    for s, p, o in g.triples((None,  RDF.type, None)):
-        if o == OWL.DatatypeProperty:
-            properties.append(s)
-        elif o == OWL.ObjectProperty:
-            properties.append(s)
-        elif o == OWL.AnnotationProperty:
-            properties.append(s)
-        elif o == RDF.Property:
-            properties.append(s)
-        else:
-            pass
-    properties = list(set(properties))
-    return properties
+    return list(TypeIndex(g).properties)
 
 def return_classes(g):
-    classes = []
-    for s, p, o in g.triples((None,  RDF.type, None)):
-        if ((o == OWL.DatatypeProperty) or 
-            (o == OWL.ObjectProperty) or 
-            (o == OWL.AnnotationProperty) or 
-            (o == RDF.Property)):
-            pass
-        elif o == RDFS.Class:
-            classes.append(s)
-        else:
-            classes.append(o)
-    classes = list(set(classes))
-    return classes
+    return list(TypeIndex(g).classes)
 
 def return_instances(g):
-    instances = []
-    for s, p, o in g.triples((None,  RDF.type, None)):
-        if ((o == OWL.DatatypeProperty) or 
-            (o == OWL.ObjectProperty) or 
-            (o == OWL.AnnotationProperty) or 
-            (o == RDF.Property) or 
-            (o == RDFS.Class)):
-            pass
-        else:
-            instances.append(s)
-    instances = list(set(instances))
-    return instances
+    return list(TypeIndex(g).instances)
 
+@wikibase_trace.phase
 def import_from_file(yaml_dict, local_settings_dict=None):
     set_default_lang(yaml_dict)
     adapter = set_up_wikibase_adapter(yaml_dict)
     if local_settings_dict:
         set_wikidata_integrator_config(adapter._local_item_engine, local_settings_dict)
     synchronizer = init_synchronizer()
-    add_from_file(yaml_dict, synchronizer, adapter)
+    return add_from_file(yaml_dict, synchronizer, adapter)
 
+@wikibase_trace.phase
 def update_from_file(yaml_dict, target_file, source_file, local_settings_dict=None):
-    with open(source_file, 'r') as f:
-        source_content = f.read()
-    with open(target_file, 'r') as f:
-        target_content = f.read()
     set_default_lang(yaml_dict)
     adapter = set_up_wikibase_adapter(yaml_dict)
     if local_settings_dict:
         set_wikidata_integrator_config(adapter._local_item_engine, local_settings_dict)
     synchronizer = init_synchronizer()
-    add_content(synchronizer, adapter, target_content, source_content, yaml_dict=yaml_dict)
+    journal = open_journal(yaml_dict, wikibase_manifest.hash_file(target_file), wikibase_manifest.hash_file(source_file))
+    stats = sync_file(synchronizer, adapter, target_file, source_file, yaml_dict=yaml_dict, journal=journal)
+    close_journal(journal, stats)
+    return stats
 
-def execute_synchronization(source_content, target_content, synchronizer, adapter):
-    ops = synchronizer.synchronize(source_content, target_content)
-    for op in ops:
-        print(op)
-        try:
-            res = op.execute(adapter)
-            if not res.successful:
-                print(f"Error synchronizing triple: {res.message}")
-        except ValueError:
-            pass # TODO: Come back and fix this!!!
-        except NotImplementedError:
-            pass # TODO: Come back and fix this!!!
+# Synchronizes the Wikibase from the contents of source_file to those of target_file.
+def sync_file(synchronizer, adapter, target_file, source_file, yaml_dict=None, journal=None):
+    if use_streaming(yaml_dict, target_file) and wikibase_stream.is_streamable(source_file):
+        return stream_content(synchronizer, adapter, target_file, source_file, yaml_dict=yaml_dict, journal=journal)
+    ops = diff_files(target_file, source_file)
+    print("%d operations to apply to synchronize %s with %s." % (len(ops), source_file, target_file))
+    return add_ops(ops, adapter, yaml_dict=yaml_dict, verbose=False, journal=journal)
+
+# Returns the operations that turn the contents of source_file into those of
+# target_file, comparing the triple hashes of both (cached) parsed graphs.
+@wikibase_trace.phase
+def diff_files(target_file, source_file):
+    source_graph = parse_file(source_file)
+    target_graph = parse_file(target_file)
+    removed, added = wikibase_diff.diff_graphs(source_graph, target_graph)
+    return build_sync_ops(removed, added, get_turtle_content(source_file, source_graph), get_turtle_content(target_file, target_graph))
+
+# Returns the wbsync operation adding an rdflib triple.
+def new_addition(*triple):
+    return AdditionOperation(*TripleInfo.from_rdflib(triple).content)
+
+# Returns the wbsync operation removing an rdflib triple.
+def new_removal(*triple):
+    return RemovalOperation(*TripleInfo.from_rdflib(triple, isAdded=False).content)
+
+# Builds the operations for diffed triples the way
+# OntologySynchronizer.synchronize builds its own: from wbsync elements,
+# without the triples wbsync cannot represent, and with every URI annotated
+# with its entity type and property datatype from both versions of the file
+# (so that properties are created as properties, with their datatype).
+def build_sync_ops(removed, added, source_content, target_content):
+    ops = filter_invalid_ops(wikibase_diff.build_ops(removed, added, new_addition, new_removal))
+    init_synchronizer()._annotate_triples(ops, source_content, target_content)
+    return ops
+
+# Returns the Turtle text of a parsed file, which the annotation step reads:
+# the file itself if it is Turtle or N-Triples, the serialized graph otherwise.
+def get_turtle_content(file_path, g):
+    if file_path and wikibase_stream.is_streamable(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    if g is None or len(g) == 0:
+        return ""
+    return g.serialize(format="turtle")
+
+def execute_synchronization(ops, adapter, yaml_dict=None, verbose=True, journal=None, type_index=None):
+    concurrency = get_sync_setting(yaml_dict, "concurrency", 1)
+    retry_policy = wikibase_failures.get_retry_policy(yaml_dict)
+    dead_letters = wikibase_failures.DeadLetterFile(wikibase_failures.get_dead_letter_path(yaml_dict)) if yaml_dict else None
+    batcher = get_batcher(yaml_dict, ops)
+    guard = None
+    if concurrency > 1:
+        guard = wikibase_executor.CreationGuard(is_mapped, wikibase_batch.TERM_PREDICATES)
+        serialize_entity_parsing()
+    stats = wikibase_executor.execute_ops(ops, adapter, concurrency=concurrency, verbose=verbose, journal=journal,
+        retry_policy=retry_policy, dead_letters=dead_letters, batcher=batcher,
+        ordered=get_sync_setting(yaml_dict, "dependency_order", True), type_index=type_index, guard=guard)
+    if batcher is not None:
+        print("Wrote %d batched entity edits." % batcher.edits)
+    if dead_letters is not None and dead_letters.count:
+        print("%d failed operations were written to %s; replay them with --replay." % (dead_letters.count, dead_letters.path))
+    stats.report()
+    return stats
+
+# wikidataintegrator parses the statements of an entity with decorators that
+# keep the statement being parsed on a shared object, so two threads parsing
+# entities at once mix up their statements (KeyError: 'snaktype'). Makes
+# parse_wd_json run one call at a time; the API requests around it still
+# run concurrently.
+def serialize_entity_parsing():
+    engine = wdi_core.WDItemEngine
+    if getattr(engine, "_parse_lock", None) is None:
+        original_parse_wd_json = engine.parse_wd_json
+        def parse_wd_json(self, wd_json):
+            with engine._parse_lock:
+                return original_parse_wd_json(self, wd_json)
+        engine._parse_lock = threading.Lock()
+        engine.parse_wd_json = parse_wd_json
 
 # TODO: Fix so can take a single file and to deal with target_content/source_content
     # Currently only functions from blank Wikibase to file; need to make able to
     # function with changes to file.
     #
     # Also need to add an export feature.
+#
+# Files that are not streamed are parsed and classified up front by
+# parse_import_files, in parallel; their operations are applied in the order
+# the files are listed. Returns the execution stats of all files.
+@wikibase_trace.phase
 def add_from_file(yaml_dict, synchronizer, adapter):
+    stats = wikibase_executor.ExecutionStats()
     if "import" in yaml_dict["wikibase"]:
+        manifest = wikibase_manifest.load_manifest(yaml_dict)
+        pending = []
         for file_path in yaml_dict["wikibase"]["import"]:
-            target_content = None
-            with open(file_path, 'r') as f:
-                target_content = f.read()
-            if target_content:
-                print(target_content)
-                add_content(synchronizer, adapter, target_content, source_content=None, yaml_dict=yaml_dict)
-
-def add_content(synchronizer, adapter, target_content, source_content=None, yaml_dict=None):
+            file_hash = wikibase_manifest.hash_file(file_path)
+            entry = wikibase_manifest.get_entry(manifest, file_path)
+            if wikibase_manifest.is_unchanged(entry, file_hash):
+                print("%s has not changed since it was last imported. Skipping..." % file_path)
+                continue
+            # Only apply the changes made since the last import, if there was one.
+            snapshot_path = wikibase_manifest.get_snapshot_path(yaml_dict, entry)
+            streamed = use_streaming(yaml_dict, file_path) and (snapshot_path is None or wikibase_stream.is_streamable(snapshot_path))
+            pending.append((file_path, file_hash, snapshot_path, streamed))
+        with parse_import_files(yaml_dict, [(file_path, snapshot_path) for file_path, _, snapshot_path, streamed in pending if not streamed]) as parsed:
+            for file_path, file_hash, snapshot_path, streamed in pending:
+                stats.merge(sync_import_file(yaml_dict, manifest, synchronizer, adapter, file_path, file_hash, snapshot_path, streamed, parsed))
+    return stats
+
+# Synchronizes one file of the import list and records it in the manifest.
+# Returns its execution stats.
+def sync_import_file(yaml_dict, manifest, synchronizer, adapter, file_path, file_hash, snapshot_path, streamed, parsed):
+    # Snapshots are named after the hash of their content.
+    snapshot_hash = os.path.splitext(os.path.basename(snapshot_path))[0] if snapshot_path else None
+    # Retrying a failed import must not apply its successful additions twice.
+    resume = wikibase_manifest.has_failures(wikibase_manifest.get_entry(manifest, file_path), file_hash)
+    journal = open_journal(yaml_dict, file_hash, snapshot_hash, resume=resume)
+    if streamed:
+        stats = stream_content(synchronizer, adapter, file_path, snapshot_path, yaml_dict=yaml_dict, journal=journal)
+    else:
+        with wikibase_trace.trace_phase("wait_for_parse"):
+            ops, type_index = next(parsed)
+        print("%d operations to apply to import %s." % (len(ops), file_path))
+        stats = add_ops(ops, adapter, yaml_dict=yaml_dict, journal=journal, type_index=type_index)
+    close_journal(journal, stats)
+    wikibase_manifest.record_import(yaml_dict, manifest, file_path, file_hash, stats)
+    return stats
+
+# Parses (file_path, snapshot_path) pairs in a pool of worker processes
+# (sync.parse_processes, default: one per core) and yields an iterator over
+# the results of parse_import_file in the order given, so that the first file
+# can be synchronized while the others are still being parsed.
+@contextlib.contextmanager
+def parse_import_files(yaml_dict, files):
+    processes = get_sync_setting(yaml_dict, "parse_processes", None) or os.cpu_count() or 1
+    cache_args = (graph_cache.cache_dir, graph_cache.max_bytes) if graph_cache else (None, 0)
+    if processes <= 1 or len(files) <= 1:
+        yield (parse_import_file(file_path, snapshot_path, *cache_args) for file_path, snapshot_path in files)
+        return
+    with ProcessPoolExecutor(max_workers=min(processes, len(files))) as pool:
+        futures = [pool.submit(parse_import_file, file_path, snapshot_path, *cache_args) for file_path, snapshot_path in files]
+        yield (future.result() for future in futures)
+
+# Parses an import file, and the snapshot of its last import if there is
+# one, and returns (ops, type_index): the operations that turn the snapshot
+# into the file (see build_sync_ops) and the type index of the file. Runs in
+# the workers of parse_import_files, so it only uses its arguments.
+def parse_import_file(file_path, snapshot_path=None, cache_dir=None, cache_max_bytes=0):
+    cache = wikibase_cache.GraphCache(cache_dir, cache_max_bytes) if cache_dir else None
+    def parse(p):
+        if cache:
+            return cache.parse(p)
+        return wikibase_triples.parse_graph(p)
+    target_graph = parse(file_path)
+    source_graph = parse(snapshot_path) if snapshot_path else wikibase_triples.new_graph()
+    removed, added = wikibase_diff.diff_graphs(source_graph, target_graph)
+    ops = build_sync_ops(removed, added, get_turtle_content(snapshot_path, source_graph), get_turtle_content(file_path, target_graph))
+    return ops, TypeIndex(target_graph)
+
+def add_content(synchronizer, adapter, target_content, source_content=None, yaml_dict=None, verbose=True, journal=None, type_index=None):
     if source_content == None:
         source_content = ""
     ops = synchronizer.synchronize(source_content, target_content)
-    print(ops)
-    executed=False
+    if verbose:
+        print(ops)
+    return add_ops(ops, adapter, yaml_dict, verbose, journal, type_index)
+
+# Executes synchronization operations and records the entities they touched.
+def add_ops(ops, adapter, yaml_dict=None, verbose=True, journal=None, type_index=None):
+    if yaml_dict:
+        preload_uris(yaml_dict, ops)
+    stats=None
     if yaml_dict:
         if "wikibase_public_host" in yaml_dict["wikibase"]:
             if yaml_dict["wikibase"]["wikibase_public_host"] == 'wikibase.example.com':
                 with no_ssl_verification():
-                    execute_synchronization(source_content, target_content, synchronizer, adapter)
-                    executed=True
-    if executed==False:
-        execute_synchronization(source_content, target_content, synchronizer, adapter)
+                    stats = execute_synchronization(ops, adapter, yaml_dict, verbose, journal, type_index)
+    if stats is None:
+        stats = execute_synchronization(ops, adapter, yaml_dict, verbose, journal, type_index)
+    if yaml_dict:
+        record_touched_entities(yaml_dict, ops)
+    return stats
+
+# Records the entity IDs whose triples the operations changed, so that the
+# query service can be updated for just those entities afterwards.
+def record_touched_entities(yaml_dict, ops):
+    if not ops:
+        return
+    factory = URIFactoryMock()
+    entity_ids = set()
+    unresolved = 0
+    subjects = {subject.uri: subject for subject in (wikibase_executor.get_op_elements(op)[0] for op in ops)}
+    for subject in subjects.values():
+        if subject.is_blank():
+            # Blank nodes end up inside the statements of their parent entity.
+            continue
+        entity_id = wikibase_wqs.get_entity_id(factory.get_uri(subject))
+        if entity_id is None:
+            unresolved += 1
+        else:
+            entity_ids.add(entity_id)
+    wikibase_wqs.add_touched_entities(yaml_dict, entity_ids, unresolved)
+
+# Opens the journal of applied operations for an import; with resume or the
+# resume setting, operations an interrupted run already applied are skipped.
+def open_journal(yaml_dict, target_hash, source_hash=None, resume=False):
+    return wikibase_journal.open_journal(yaml_dict, target_hash, source_hash,
+        resume=resume or get_sync_setting(yaml_dict, "resume", False))
+
+# Closes a journal, deleting it if the import finished without failures.
+def close_journal(journal, stats):
+    if stats is not None and stats.failures == 0:
+        journal.remove()
+    else:
+        journal.close()
+
+# Returns True if a file should be imported with the streaming mode.
+def use_streaming(yaml_dict, file_path):
+    if get_sync_setting(yaml_dict, "stream", False):
+        if wikibase_stream.is_streamable(file_path):
+            return True
+        print("Streaming is only supported for Turtle and N-Triples files; reading %s in full." % file_path)
+    return False
+
+# Synchronizes a file in subject-grouped chunks so that only one chunk of the
+# file (and of the previous version, if given) is held in memory at a time.
+# File contents and individual operations are not printed in this mode. The
+# operations of every chunk are scheduled with the type index of the whole
+# target file, so that subjects typed in another chunk are ranked correctly.
+def stream_content(synchronizer, adapter, target_file, source_file=None, yaml_dict=None, journal=None):
+    memory_limit_mb = get_sync_setting(yaml_dict, "stream_memory_mb", 256)
+    memory_limit_bytes = memory_limit_mb * 1024 * 1024
+    type_index = index_file_types(target_file, wikibase_stream.get_chunk_bytes(memory_limit_bytes))
+    stats = wikibase_executor.ExecutionStats()
+    with wikibase_stream.subject_chunks(target_file, source_file, memory_limit_bytes) as chunks:
+        for source_chunk, target_chunk in chunks:
+            stats.merge(add_content(synchronizer, adapter, target_chunk, source_chunk, yaml_dict=yaml_dict, verbose=False, journal=journal,
+                type_index=type_index))
+    stats.report("Streamed synchronization of %s" % target_file)
+    return stats
+
+# Builds the type index of a streamable file, parsing it in batches of about
+# batch_bytes so that only the index is kept in memory.
+@wikibase_trace.phase
+def index_file_types(file_path, batch_bytes):
+    type_index = TypeIndex()
+    for batch in wikibase_stream.iter_statement_batches(file_path, batch_bytes):
+        type_index.add_graph(rdflib.Graph().parse(data=batch, format="turtle"))
+    return type_index
+
+# Rebuilds the operations of dead-letter entries from wbsync elements, with
+# the annotations they were written with.
+def build_dead_letter_ops(entries):
+    op_types = {"AdditionOperation": new_addition, "RemovalOperation": new_removal}
+    return [wikibase_failures.annotate_op(op_types[entry["type"]](*entry["terms"]), entry.get("annotations")) for entry in entries]
+
+# Returns True if a URI is mapped to a Wikibase entity already.
+def is_mapped(uri):
+    return URIFactoryMock().get_uri(get_uri_element(uri)) is not None
+
+# Returns the Wikibase entity ID (e.g. Q42) a URI is mapped to, or None.
+def resolve_entity_id(uri):
+    return wikibase_wqs.get_entity_id(URIFactoryMock().get_uri(get_uri_element(uri)))
+
+# Returns the wbsync element the URI factory looks a URI or blank node up by;
+# accepts the element itself or an rdflib term.
+def get_uri_element(uri):
+    if hasattr(uri, "uri"):
+        return uri
+    return TripleElement.from_rdflib(uri)
+
+# Returns an entity batcher if batched edits are enabled (sync.batch_edits),
+# with the datatypes of the properties the operations use prefetched.
+def get_batcher(yaml_dict, ops):
+    if not get_sync_setting(yaml_dict, "batch_edits", False):
+        return None
+    batcher = wikibase_batch.EntityBatcher(get_batch_session(yaml_dict), resolve_entity_id)
+    property_ids = set(resolve_entity_id(wikibase_executor.get_op_triple(op)[1]) for op in ops)
+    batcher.prefetch_datatypes(property_id for property_id in property_ids if property_id and property_id.startswith("P"))
+    return batcher
+
+# Returns the session used for batched edits, creating it on first use.
+def get_batch_session(yaml_dict):
+    api_url = get_api_endpoint(yaml_dict)
+    if api_url not in batch_sessions:
+        verify = yaml_dict["wikibase"].get("wikibase_public_host") != 'wikibase.example.com'
+        batch_sessions[api_url] = wikibase_batch.MediaWikiSession(api_url, wikibase_config.get_mw_admin_name(yaml_dict),
+            wikibase_config.get_mw_admin_password(yaml_dict), verify=verify)
+    return batch_sessions[api_url]
+
+# Executes the operations of a dead-letter file again, without rerunning the
+# import. Operations that still fail are written to a new dead-letter file.
+@wikibase_trace.phase
+def replay_dead_letters(yaml_dict, dead_letter_path=None):
+    if dead_letter_path is None:
+        dead_letter_path = wikibase_failures.get_dead_letter_path(yaml_dict)
+    entries = wikibase_failures.load_dead_letters(dead_letter_path)
+    if not entries:
+        print("No failed operations to replay in %s." % dead_letter_path)
+        return None
+    print("Replaying %d failed operations from %s." % (len(entries), dead_letter_path))
+    replaying_path = dead_letter_path + ".replaying"
+    os.replace(dead_letter_path, replaying_path)
+    set_default_lang(yaml_dict)
+    adapter = set_up_wikibase_adapter(yaml_dict)
+    ops = build_dead_letter_ops(entries)
+    try:
+        stats = add_ops(ops, adapter, yaml_dict)
+    except BaseException:
+        os.replace(replaying_path, dead_letter_path)
+        raise
+    os.remove(replaying_path)
+    return stats
 
 def set_up_wikibase_adapter(yaml_dict):
     mediawiki_api_url=get_api_endpoint(yaml_dict)
@@ -209,6 +499,26 @@ def set_wikidata_integrator_config(item_engine, local_settings_dict):
 def init_factory(yaml_dict):
     factory = URIFactoryMock()
     factory.reset_factory()
+    get_uri_store(yaml_dict)
+
+# Returns the project's persistent URI store, attaching it to URIFactoryMock
+# on first use so that entities created in earlier runs resolve locally.
+def get_uri_store(yaml_dict):
+    global uri_store
+    if uri_store is None:
+        uri_store = wikibase_uri_store.open_uri_store(yaml_dict).attach(URIFactoryMock)
+    return uri_store
+
+# Loads the stored entities of every URI the operations mention into the
+# URI factory with one bulk lookup.
+def preload_uris(yaml_dict, ops):
+    elements = []
+    for op in ops:
+        for element in wikibase_executor.get_op_elements(op):
+            if element.is_uri():
+                elements.append(element)
+    if elements:
+        get_uri_store(yaml_dict).preload(URIFactoryMock(), elements)
 
 # Adapted from: https://stackoverflow.com/questions/15445981/how-do-i-disable-the-security-certificate-check-in-python-requests
 @contextlib.contextmanager
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_index.py
+#
+
+from collections import Counter
+from rdflib.namespace import OWL, RDF, RDFS
+
+PROPERTY_TYPES = frozenset([
+    OWL.DatatypeProperty,
+    OWL.ObjectProperty,
+    OWL.AnnotationProperty,
+    RDF.Property
+])
+
+# Types whose instances are classes themselves.
+CLASS_TYPES = frozenset([
+    OWL.Class,
+    RDFS.Class
+])
+
+# Classifies the subjects of rdf:type triples into properties, classes and
+# instances in a single pass. Triples from several graphs (or files) can be
+# added to the same index.
+class TypeIndex:
+
+    def __init__(self, g=None):
+        self.properties = set()
+        self.classes = set()
+        self.instances = set()
+        self.type_counts = Counter()
+        if g is not None:
+            self.add_graph(g)
+
+    def add_graph(self, g):
+        self.add_triples(g.triples((None, RDF.type, None)))
+        return self
+
+    def add_triples(self, triples):
+        for s, p, o in triples:
+            if p != RDF.type:
+                continue
+            self.type_counts[o] += 1
+            if o in PROPERTY_TYPES:
+                self.properties.add(s)
+            elif o in CLASS_TYPES:
+                self.classes.add(s)
+            else:
+                self.classes.add(o)
+                self.instances.add(s)
+        return self
+
+    def update(self, other):
+        self.properties |= other.properties
+        self.classes |= other.classes
+        self.instances |= other.instances
+        self.type_counts.update(other.type_counts)
+        return self
+
+    def is_property(self, term):
+        return term in self.properties
+
+    def is_class(self, term):
+        return term in self.classes
+
+    def is_instance(self, term):
+        return term in self.instances
+
+    def count(self, rdf_type):
+        return self.type_counts[rdf_type]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_journal.py
+#
+
+import hashlib
+import json
+import os
+import threading
+import time
+import wikibase_executor
+
+from collections import Counter
+from rdflib import BNode
+
+JOURNAL_DIR = "journal"
+
+# Placeholder for blank nodes, whose labels change every time a file is parsed.
+BNODE_PLACEHOLDER = "_:"
+
+def get_journal_dir(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), JOURNAL_DIR)
+
+# Returns the journal path for an import of target_hash, diffed against
+# source_hash if the import starts from an earlier version.
+def get_journal_path(yaml_dict, target_hash, source_hash=None):
+    name = target_hash if source_hash is None else "%s-%s" % (source_hash, target_hash)
+    return os.path.join(get_journal_dir(yaml_dict), name + ".jsonl")
+
+def get_term_key(term):
+    if isinstance(term, BNode):
+        return BNODE_PLACEHOLDER
+    return term.n3()
+
+# Returns the key an operation's ID is derived from: its type and the N3 form
+# of its terms, with blank nodes replaced by a placeholder.
+def get_op_key(op):
+    return " ".join([type(op).__name__] + [get_term_key(term) for term in wikibase_executor.get_op_triple(op)])
+
+# Returns a stable ID for every operation, in order. Operations that only
+# differ in their blank nodes share a key, so an occurrence counter keeps
+# their IDs apart. Passing the same occurrences counter to successive calls
+# keeps IDs unique across chunks of one import.
+def get_op_ids(ops, occurrences=None):
+    if occurrences is None:
+        occurrences = Counter()
+    op_ids = []
+    for op in ops:
+        key = get_op_key(op)
+        op_ids.append(hashlib.sha1(("%s #%d" % (key, occurrences[key])).encode("utf-8")).hexdigest())
+        occurrences[key] += 1
+    return op_ids
+
+# Append-only record of the operations of one import that were applied
+# successfully, so that an interrupted import can carry on where it stopped.
+class OpJournal:
+
+    def __init__(self, journal_path, resume=False):
+        self.journal_path = journal_path
+        self.done = set()
+        self._op_ids = {}
+        self._occurrences = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        if resume:
+            self.done = load_journal(journal_path)
+        elif os.path.isfile(journal_path):
+            os.remove(journal_path)
+        self._file = open(journal_path, 'a')
+        if self._file.tell() > 0 and not ends_with_newline(journal_path):
+            self._file.write("\n")
+
+    # Returns the operations that are not in the journal yet, remembering
+    # their IDs for record().
+    def pending(self, ops):
+        pending = []
+        for op, op_id in zip(ops, get_op_ids(ops, self._occurrences)):
+            if op_id in self.done:
+                continue
+            self._op_ids[id(op)] = op_id
+            pending.append(op)
+        skipped = len(ops) - len(pending)
+        if skipped:
+            print("Skipping %d of %d operations already applied according to %s." % (skipped, len(ops), self.journal_path))
+        return pending
+
+    # Records an operation as applied.
+    def record(self, op):
+        op_id = self._op_ids.get(id(op))
+        if op_id is None:
+            return
+        with self._lock:
+            self.done.add(op_id)
+            self._file.write(json.dumps({"id": op_id, "type": type(op).__name__, "time": round(time.time(), 3)}) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    # Closes and deletes the journal once its import has finished cleanly.
+    def remove(self):
+        self.close()
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+# Returns the IDs recorded in a journal. A line cut off by a crash is ignored.
+def load_journal(journal_path):
+    done = set()
+    if os.path.isfile(journal_path):
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+def ends_with_newline(journal_path):
+    with open(journal_path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+def open_journal(yaml_dict, target_hash, source_hash=None, resume=False):
+    return OpJournal(get_journal_path(yaml_dict, target_hash, source_hash), resume=resume)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_manifest.py
+#
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+MANIFEST_FILE = "import_manifest.json"
+SNAPSHOT_DIR = "import_snapshots"
+
+# Returns the directory holding the manifest and snapshots for a project.
+def get_manifest_dir(yaml_dict):
+    return "./target/"+str(yaml_dict["repo"])
+
+def get_manifest_path(yaml_dict):
+    return os.path.join(get_manifest_dir(yaml_dict), MANIFEST_FILE)
+
+# Returns the SHA-256 hex digest of a file, read in blocks.
+def hash_file(file_path, block_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def get_manifest_key(file_path):
+    return os.path.normpath(str(file_path))
+
+def load_manifest(yaml_dict):
+    manifest_path = get_manifest_path(yaml_dict)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(yaml_dict, manifest):
+    manifest_path = get_manifest_path(yaml_dict)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# Returns the manifest entry for a file, or None if it was never imported.
+def get_entry(manifest, file_path):
+    return manifest.get(get_manifest_key(file_path))
+
+# Returns True if the file was imported without failures and has not changed since.
+def is_unchanged(entry, file_hash):
+    return bool(entry) and entry["sha256"] == file_hash and entry.get("failures", 0) == 0
+
+# Returns True if the file was last imported with failures and has not changed
+# since: the retry diffs against the same snapshot, and the journal of the
+# failed import records which of its operations were applied.
+def has_failures(entry, file_hash):
+    return bool(entry) and entry["sha256"] == file_hash and entry.get("failures", 0) > 0
+
+# Returns the snapshot of the file as last imported, or None if there is none.
+def get_snapshot_path(yaml_dict, entry):
+    if entry and entry.get("snapshot"):
+        snapshot_path = os.path.join(get_manifest_dir(yaml_dict), entry["snapshot"])
+        if os.path.isfile(snapshot_path):
+            return snapshot_path
+    return None
+
+# Records a finished import. A snapshot of the imported file is kept so that
+# the next change can be diffed against it; if some operations failed, the
+# previous clean snapshot stays the diff base so the failures are retried.
+def record_import(yaml_dict, manifest, file_path, file_hash, stats):
+    key = get_manifest_key(file_path)
+    old_entry = manifest.get(key)
+    old_snapshot = old_entry.get("snapshot") if old_entry else None
+    failures = stats.failures if stats else 0
+    if failures > 0:
+        snapshot = old_snapshot
+    else:
+        extension = os.path.splitext(str(file_path))[1]
+        snapshot = os.path.join(SNAPSHOT_DIR, file_hash + extension)
+        snapshot_path = os.path.join(get_manifest_dir(yaml_dict), snapshot)
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        if not os.path.isfile(snapshot_path):
+            shutil.copyfile(file_path, snapshot_path)
+    manifest[key] = {
+        "sha256": file_hash,
+        "ops": stats.total if stats else 0,
+        "failures": failures,
+        "snapshot": snapshot,
+        "imported_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    save_manifest(yaml_dict, manifest)
+    if old_snapshot and old_snapshot != snapshot:
+        if not any(entry.get("snapshot") == old_snapshot for entry in manifest.values()):
+            try:
+                os.remove(os.path.join(get_manifest_dir(yaml_dict), old_snapshot))
+            except FileNotFoundError:
+                pass
+
+# Forgets every recorded import (e.g. after the Wikibase volumes are removed).
+def clear_manifest(yaml_dict):
+    manifest_dir = get_manifest_dir(yaml_dict)
+    try:
+        os.remove(get_manifest_path(yaml_dict))
+    except FileNotFoundError:
+        pass
+    shutil.rmtree(os.path.join(manifest_dir, SNAPSHOT_DIR), ignore_errors=True)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_php.py
+#
+
+import re
+
+from collections import OrderedDict
+
+PHP_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<tag><\?php|\?>)
+  | (?P<sq>'(?:[^'\\]|\\.)*')
+  | (?P<dq>"(?:[^"\\]|\\.)*")
+  | (?P<var>\$[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<num>(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_\\][A-Za-z0-9_\\]*)
+  | (?P<op>=>|\.=|\+=|-=|===|!==|==|!=|::|->|\?\?|[=\[\](){};,.:?!<>+\-*/&|@%^~])
+  | (?P<other>.)
+""", re.S | re.X)
+
+INTERPOLATION_RE = re.compile(r'(?<!\\)(\{)?\$([A-Za-z_][A-Za-z0-9_]*)(?(1)\})')
+
+DOUBLE_QUOTE_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\', '$': '$', 'v': '\v', 'f': '\f', '0': '\0'}
+
+ASSIGNMENT_OPERATORS = ('=', '.=', '+=', '-=')
+
+# Ends an expression when found at nesting depth zero.
+EXPRESSION_END = (',', ']', ')', ';', '=>', '}')
+
+# Splits PHP source into (kind, value, start, end) tokens, dropping
+# whitespace, comments and open/close tags.
+def tokenize(text):
+    tokens = []
+    for m in PHP_TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind in ('ws', 'comment', 'tag'):
+            continue
+        tokens.append((kind, m.group(), m.start(), m.end()))
+    return tokens
+
+def unquote(kind, value):
+    body = value[1:-1]
+    if kind == 'sq':
+        return re.sub(r"\\([\\'])", r"\1", body)
+    return re.sub(r'\\(.)', lambda m: DOUBLE_QUOTE_ESCAPES.get(m.group(1), m.group(0)), body)
+
+# A bare PHP constant (e.g. CACHE_NONE or __DIR__), kept under its own name.
+class PhpConstant(str):
+    pass
+
+# Formats the lookup key of a (possibly nested) variable, for example
+# wgWBRepoSettings['string-limits']['VT:string']['length'].
+def format_key(name, keys=()):
+    key = name
+    for k in keys:
+        if isinstance(k, int) and not isinstance(k, bool):
+            key += "[%d]" % k
+        else:
+            key += "['%s']" % k
+    return key
+
+# Parses the variable assignments of a PHP file (such as LocalSettings.php).
+# Scalars, strings, constants, concatenation, short and long array syntax,
+# nested array keys and references to earlier variables are evaluated;
+# anything else is kept as its PHP source text.
+class PhpSettingsParser:
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.values = OrderedDict()
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        if index < len(self.tokens):
+            return self.tokens[index]
+        return (None, None, len(self.text), len(self.text))
+
+    def peek_value(self, offset=0):
+        return self.peek(offset)[1]
+
+    def advance(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+    def parse(self):
+        while not self.at_end():
+            kind, value, _, _ = self.peek()
+            if kind == 'var':
+                self.parse_statement()
+            else:
+                self.advance()
+        return self.values
+
+    def parse_statement(self):
+        name = self.advance()[1][1:]
+        keys = []
+        while self.peek_value() == '[':
+            self.advance()
+            if self.peek_value() == ']':
+                keys.append(None)
+            else:
+                keys.append(self.parse_expression())
+            if self.peek_value() == ']':
+                self.advance()
+        operator = self.peek_value()
+        if operator in ASSIGNMENT_OPERATORS:
+            self.advance()
+            value = self.parse_expression()
+            self.assign(name, keys, operator, value)
+            self.skip_to(';')
+        # Anything else (a condition, a call, a loop) is left to parse(), which
+        # walks into its blocks so that nested assignments are kept too.
+
+    # Skips to the end of the current statement, stopping before the bracket
+    # that closes its enclosing block or expression.
+    def skip_to(self, value):
+        depth = 0
+        while not self.at_end():
+            token_value = self.peek_value()
+            if depth == 0 and (token_value == value or token_value in (')', ']', '}')):
+                if token_value == value:
+                    self.advance()
+                return
+            if token_value in ('(', '[', '{'):
+                depth += 1
+            elif token_value in (')', ']', '}'):
+                depth -= 1
+            self.advance()
+
+    def raw_from(self, start_pos):
+        start = self.tokens[start_pos][2] if start_pos < len(self.tokens) else len(self.text)
+        end = self.tokens[self.pos - 1][3] if self.pos > start_pos else start
+        return self.text[start:end]
+
+    def parse_expression(self):
+        start_pos = self.pos
+        value = self.parse_term()
+        evaluated = True
+        while not self.at_end() and self.peek_value() not in EXPRESSION_END:
+            if self.peek_value() == '.' and evaluated:
+                self.advance()
+                right = self.parse_term()
+                if is_concatenable(value) and is_concatenable(right):
+                    value = str(value) + str(right)
+                else:
+                    evaluated = False
+            else:
+                evaluated = False
+                self.skip_balanced()
+        if not evaluated:
+            return self.raw_from(start_pos)
+        return value
+
+    def skip_balanced(self):
+        token_value = self.advance()[1]
+        if token_value in ('(', '[', '{'):
+            depth = 1
+            while not self.at_end() and depth > 0:
+                inner = self.advance()[1]
+                if inner in ('(', '[', '{'):
+                    depth += 1
+                elif inner in (')', ']', '}'):
+                    depth -= 1
+
+    def parse_term(self):
+        start_pos = self.pos
+        kind, value, _, _ = self.peek()
+        if kind == 'sq':
+            self.advance()
+            return unquote(kind, value)
+        if kind == 'dq':
+            self.advance()
+            return unquote(kind, self.interpolate(value))
+        if kind == 'num':
+            self.advance()
+            if value.isdigit():
+                return int(value)
+            return float(value)
+        if value == '-' and self.peek(1)[0] == 'num':
+            self.advance()
+            return -self.parse_term()
+        if value in ('@', '+'):
+            self.advance()
+            return self.parse_term()
+        if value == '[':
+            self.advance()
+            return self.parse_array(']')
+        if value == '(':
+            self.advance()
+            inner = self.parse_expression()
+            if self.peek_value() == ')':
+                self.advance()
+            return inner
+        if kind == 'var':
+            self.advance()
+            keys = []
+            while self.peek_value() == '[':
+                self.advance()
+                keys.append(self.parse_expression())
+                if self.peek_value() == ']':
+                    self.advance()
+            found, resolved = self.lookup(value[1:], keys)
+            if found:
+                return resolved
+            return self.raw_from(start_pos)
+        if kind == 'name':
+            self.advance()
+            lowered = value.lower()
+            if lowered == 'array' and self.peek_value() == '(':
+                self.advance()
+                return self.parse_array(')')
+            if self.peek_value() in ('(', '::'):
+                # Function call or class constant; keep the source text.
+                if self.peek_value() == '::':
+                    self.advance()
+                    self.advance()
+                if self.peek_value() == '(':
+                    self.skip_balanced()
+                return self.raw_from(start_pos)
+            if lowered == 'true':
+                return True
+            if lowered == 'false':
+                return False
+            if lowered == 'null':
+                return None
+            return PhpConstant(value)
+        if kind is not None:
+            self.skip_balanced()
+        return self.raw_from(start_pos)
+
+    def parse_array(self, closing):
+        items = []
+        is_assoc = False
+        while not self.at_end() and self.peek_value() != closing:
+            item = self.parse_expression()
+            key = None
+            if self.peek_value() == '=>':
+                self.advance()
+                key = item
+                item = self.parse_expression()
+                is_assoc = True
+            items.append((key, item))
+            if self.peek_value() == ',':
+                self.advance()
+            elif self.peek_value() != closing:
+                self.advance()
+        if self.peek_value() == closing:
+            self.advance()
+        if not is_assoc:
+            return [item for _, item in items]
+        array = OrderedDict()
+        next_index = 0
+        for key, item in items:
+            if key is None:
+                key = next_index
+            if isinstance(key, bool):
+                key = int(key)
+            if isinstance(key, int):
+                next_index = max(next_index, key + 1)
+            array[key] = item
+        return array
+
+    # Substitutes simple variables that are already known into a double-quoted string.
+    def interpolate(self, value):
+        def substitute(m):
+            found, resolved = self.lookup(m.group(2), [])
+            if found and is_concatenable(resolved):
+                return str(resolved).replace('\\', '\\\\').replace('"', '\\"')
+            return m.group(0)
+        return INTERPOLATION_RE.sub(substitute, value)
+
+    def lookup(self, name, keys):
+        if name not in self.values:
+            return (False, None)
+        value = self.values[name]
+        for key in keys:
+            if isinstance(value, dict) and key in value:
+                value = value[key]
+            elif isinstance(value, list) and isinstance(key, int) and 0 <= key < len(value):
+                value = value[key]
+            else:
+                return (False, None)
+        return (True, value)
+
+    def assign(self, name, keys, operator, value):
+        if not keys:
+            self.values[name] = combine(self.values.get(name), operator, value)
+            return
+        if not isinstance(self.values.get(name), (dict, list)):
+            self.values[name] = OrderedDict()
+        container = self.values[name]
+        parent, parent_key = self.values, name
+        for key in keys[:-1]:
+            container = as_dict(container, parent, parent_key)
+            if key is None:
+                key = next_key(container)
+            if not isinstance(container.get(key), (dict, list)):
+                container[key] = OrderedDict()
+            parent, parent_key = container, key
+            container = container[key]
+        last = keys[-1]
+        if isinstance(container, list) and last is None and operator == '=':
+            container.append(value)
+            return
+        container = as_dict(container, parent, parent_key)
+        if last is None:
+            last = next_key(container)
+        container[last] = combine(container.get(last), operator, value)
+
+def is_concatenable(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, (bool, PhpConstant))
+
+# Converts a PHP list (Python list) into a dict with integer keys in place.
+def as_dict(container, parent, parent_key):
+    if isinstance(container, list):
+        container = OrderedDict(enumerate(container))
+        parent[parent_key] = container
+    return container
+
+def next_key(container):
+    int_keys = [k for k in container if isinstance(k, int) and not isinstance(k, bool)]
+    return max(int_keys) + 1 if int_keys else 0
+
+def combine(old_value, operator, value):
+    if operator == '.=' and old_value is not None:
+        return str(old_value) + str(value)
+    if operator == '+=' and old_value is not None:
+        if isinstance(old_value, dict) and isinstance(value, dict):
+            merged = OrderedDict(old_value)
+            for k, v in value.items():
+                merged.setdefault(k, v)
+            return merged
+        if isinstance(old_value, (int, float)) and isinstance(value, (int, float)):
+            return old_value + value
+    if operator == '-=' and isinstance(old_value, (int, float)) and isinstance(value, (int, float)):
+        return old_value - value
+    return value
+
+# Flattens parsed values into a dict with one entry for every variable and
+# every nested array key, so that any setting can be looked up directly.
+def build_index(values):
+    index = {}
+    def walk(key, value):
+        index[key] = value
+        if isinstance(value, dict):
+            for k, v in value.items():
+                walk(format_key(key, [k]), v)
+        elif isinstance(value, list):
+            for k, v in enumerate(value):
+                walk(format_key(key, [k]), v)
+    for name, value in values.items():
+        walk(name, value)
+    return index
+
+# Parses PHP source and returns the flat settings index.
+def parse_settings(text):
+    return build_index(PhpSettingsParser(text).parse())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_rebuild.py
+#
+
+import json
+import os
+import time
+import wikibase_trace
+
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from wikibase_session import CommandSession, SessionError
+
+REBUILD_STATE_FILE = "rebuild_state.json"
+
+# Kinds of state an import can make stale: 'pages' for wiki pages written
+# directly (e.g. by importDump.php), 'entities' for entities edited through
+# the API.
+PAGES = "pages"
+ENTITIES = "entities"
+ALL_INPUTS = frozenset([PAGES, ENTITIES])
+
+# Run command to insert new entities (items, properties, lexemes), per Phabricator ticket here:
+# https://phabricator.wikimedia.org/T368164
+ID_COUNTER_QUERY = ("php /var/www/html/maintenance/run.php sql --query \"INSERT INTO wb_id_counters (id_type, id_value) "
+    "VALUES ('%s', (SELECT COALESCE(MAX(CAST(SUBSTRING(page_title, 2) AS UNSIGNED)), 0) FROM page WHERE page_namespace = %d)) "
+    "ON DUPLICATE KEY UPDATE id_value = (SELECT COALESCE(MAX(CAST(SUBSTRING(page_title, 2) AS UNSIGNED)), 0) FROM page WHERE page_namespace = %d);\"")
+
+def id_counter_query(id_type, namespace):
+    return ID_COUNTER_QUERY % (id_type, namespace, namespace)
+
+# A maintenance step: the commands it runs, the kinds of state it rebuilds
+# from (it runs only if one of them is stale) and the steps it must follow.
+class RebuildStep:
+
+    def __init__(self, name, commands, inputs, after=()):
+        self.name = name
+        self.commands = commands
+        self.inputs = frozenset(inputs)
+        self.after = tuple(after)
+
+    def __repr__(self):
+        return "RebuildStep(%r)" % self.name
+
+REBUILD_STEPS = OrderedDict((step.name, step) for step in [
+    RebuildStep("rebuildall", [
+        "php /var/www/html/maintenance/rebuildall.php"
+    ], [PAGES]),
+    RebuildStep("run_jobs", [
+        "php /var/www/html/maintenance/runJobs.php --memory-limit 512M"
+    ], [PAGES, ENTITIES], after=["rebuildall"]),
+    RebuildStep("site_stats", [
+        "php /var/www/html/maintenance/initSiteStats.php --update"
+    ], [PAGES, ENTITIES], after=["rebuildall"]),
+    RebuildStep("id_counters", [
+        "php /var/www/html/maintenance/sql.php /var/www/html/rebuildWikibaseIdCounters.sql",
+        id_counter_query("wikibase-item", 120),
+        id_counter_query("wikibase-property", 122),
+        id_counter_query("wikibase-lexeme", 146)
+    ], [PAGES], after=["rebuildall"]),
+    RebuildStep("constraints", [
+        "php /var/www/html/maintenance/run.php WikibaseQualityConstraints:ImportConstraintStatements.php"
+    ], [PAGES, ENTITIES], after=["id_counters"]),
+    RebuildStep("search_config", [
+        "php /var/www/html/extensions/CirrusSearch/maintenance/UpdateSearchIndexConfig.php --startOver"
+    ], [PAGES], after=["run_jobs", "site_stats"]),
+    RebuildStep("search_index", [
+        "php /var/www/html/extensions/CirrusSearch/maintenance/ForceSearchIndex.php"
+    ], [PAGES, ENTITIES], after=["search_config", "run_jobs"]),
+    # Run jobs (necessary for autocomplete and search to function).
+    RebuildStep("final_jobs", [
+        "php /var/www/html/maintenance/runJobs.php --memory-limit 512M"
+    ], [PAGES, ENTITIES], after=["search_index", "constraints"])
+])
+
+def get_rebuild_state_path(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), REBUILD_STATE_FILE)
+
+# Returns the kinds of state left stale by imports since the last rebuild.
+def load_stale(yaml_dict):
+    if yaml_dict is None:
+        return set()
+    state_path = get_rebuild_state_path(yaml_dict)
+    if os.path.isfile(state_path):
+        with open(state_path, 'r') as f:
+            return set(json.load(f).get("stale", []))
+    return set()
+
+def save_stale(yaml_dict, stale):
+    if yaml_dict is None:
+        return
+    state_path = get_rebuild_state_path(yaml_dict)
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"stale": sorted(stale)}, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+# Records that an import made the given kinds of state stale.
+def mark_stale(yaml_dict, *inputs):
+    save_stale(yaml_dict, load_stale(yaml_dict) | set(inputs))
+
+# Returns the steps that have to run for the stale state, in declared order.
+def plan_steps(stale, steps=REBUILD_STEPS):
+    return OrderedDict((name, step) for name, step in steps.items() if step.inputs & stale)
+
+# Runs one step in its own shell in the wikibase container and returns
+# (successful, seconds).
+def run_step(step):
+    start = time.perf_counter()
+    try:
+        with wikibase_trace.trace_phase("rebuild:" + step.name), CommandSession(echo=False) as session:
+            for command in step.commands:
+                session.queue(command)
+    except SessionError as e:
+        print("[%s] %s" % (step.name, e))
+        return False, time.perf_counter() - start
+    seconds = time.perf_counter() - start
+    for result in session.results:
+        if not result.successful:
+            print("[%s] exit %d: %s\n%s" % (step.name, result.returncode, result.command, result.output))
+    return all(result.successful for result in session.results), seconds
+
+# Runs the planned steps as a DAG: a step starts once every planned step it
+# follows has finished, independent steps run concurrently, and the
+# dependents of a failed step are skipped. Returns {name: (status, seconds)}.
+def run_steps(planned, max_workers=4):
+    outcomes = OrderedDict()
+    waiting = OrderedDict(planned)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting or running:
+            progress = True
+            while progress:
+                progress = False
+                for name, step in list(waiting.items()):
+                    blockers = [dep for dep in step.after if dep in planned]
+                    if any(outcomes.get(dep, ("",))[0] in ("failed", "skipped") for dep in blockers):
+                        outcomes[name] = ("skipped", 0.0)
+                    elif all(dep in outcomes for dep in blockers):
+                        print("Starting rebuild step %s." % name)
+                        running[executor.submit(run_step, step)] = name
+                    else:
+                        continue
+                    del waiting[name]
+                    progress = True
+            if not running:
+                if waiting:
+                    raise ValueError("Rebuild steps %s depend on each other." % ", ".join(waiting))
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                successful, seconds = future.result()
+                outcomes[name] = ("ok" if successful else "failed", seconds)
+                print("Finished rebuild step %s in %.1fs (%s)." % (name, seconds, outcomes[name][0]))
+    return outcomes
+
+def report_steps(outcomes, steps=REBUILD_STEPS, elapsed=None):
+    for name in steps:
+        status, seconds = outcomes.get(name, ("not stale", 0.0))
+        print("%-15s %-10s %7.1fs" % (name, status, seconds))
+    if elapsed is not None:
+        print("Rebuild finished in %.1fs (%.1fs of step time)." % (elapsed, sum(seconds for _, seconds in outcomes.values())))
+
+# Brings derived state (links, job queue, site statistics, id counters,
+# constraints and search indexes) up to date after an import. Only steps
+# whose inputs are stale run; with force, everything runs. The stale state
+# is cleared once every step succeeded.
+@wikibase_trace.phase
+def run_rebuild(yaml_dict=None, stale=None, force=False, max_workers=4):
+    stale = load_stale(yaml_dict) | set(stale or ())
+    if force:
+        stale = set(ALL_INPUTS)
+    planned = plan_steps(stale)
+    if not planned:
+        print("Nothing is stale; skipping the rebuild.")
+        return True
+    start = time.perf_counter()
+    outcomes = run_steps(planned, max_workers=max_workers)
+    report_steps(outcomes, elapsed=time.perf_counter() - start)
+    successful = all(status == "ok" for status, _ in outcomes.values())
+    save_stale(yaml_dict, set() if successful else stale)
+    return successful
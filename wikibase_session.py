@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_session.py
+#
+
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+WIKIBASE_CONTAINER = "wbs-deploy-wikibase-1"
+
+# Raised when the shell of a session exits before its commands have finished
+# (e.g. the container is not running).
+class SessionError(RuntimeError):
+    pass
+
+# Outcome of one command run inside a session.
+class CommandResult:
+
+    def __init__(self, command, returncode, seconds, output):
+        self.command = command
+        self.returncode = returncode
+        self.seconds = seconds
+        self.output = output
+
+    @property
+    def successful(self):
+        return self.returncode == 0
+
+    def __repr__(self):
+        return "CommandResult(%r, returncode=%r, seconds=%.2f)" % (self.command, self.returncode, self.seconds)
+
+# Keeps one long-lived shell open in a container and runs queued commands in
+# it in batches, recording the exit code and duration of each command. Each
+# command runs in its own subshell with stdin closed, so it cannot consume
+# the commands queued after it.
+class CommandSession:
+
+    def __init__(self, container=WIKIBASE_CONTAINER, echo=True):
+        self.container = container
+        self.echo = echo
+        self.pending = []
+        self.results = []
+        self._process = None
+        self._marker = "__wikiodk_%s__" % uuid.uuid4().hex
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
+
+    def open(self):
+        if self._process is None:
+            self._process = subprocess.Popen('docker exec -i %s //bin//bash' % self.container, shell=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return self
+
+    def close(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.write(b"exit\n")
+                self._process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.wait()
+            self._process = None
+
+    # Adds a command to the next batch.
+    def queue(self, command):
+        self.pending.append(command)
+        return self
+
+    # Adds every command line of a shell script to the next batch.
+    def queue_script(self, script_path):
+        with open(script_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    self.queue(line)
+        return self
+
+    # Adds a command that writes a local text file into the container.
+    def queue_file(self, local_path, container_path):
+        with open(local_path, 'r') as f:
+            return self.queue_text(f.read(), container_path)
+
+    # Adds a command that writes the given text to a file in the container.
+    def queue_text(self, content, container_path):
+        delimiter = self._marker + "_EOF"
+        if not content.endswith("\n"):
+            content += "\n"
+        return self.queue("cat > %s <<'%s'\n%s%s" % (container_path, delimiter, content, delimiter))
+
+    # Runs a single command right away and returns its result.
+    def run(self, command):
+        self.flush()
+        self.queue(command)
+        return self.flush()[0]
+
+    # The marker line starts with a newline so that it is never glued to the
+    # last line of output of a command that does not end with one.
+    def _wrap(self, index, command):
+        return ('__t0=$(date +%%s%%N); (\n%s\n) </dev/null 2>&1; __rc=$?; __t1=$(date +%%s%%N); '
+                'printf \'\\n%s %d %%s %%s %%s\\n\' "$__rc" "$__t0" "$__t1"\n') % (command, self._marker, index)
+
+    def _write_batch(self, batch):
+        try:
+            self._process.stdin.write(batch)
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            pass
+
+    # Runs every queued command and returns their results in order. Raises
+    # SessionError if the shell exits before all of them have finished.
+    def flush(self):
+        if not self.pending:
+            return []
+        self.open()
+        commands = self.pending
+        self.pending = []
+        batch = "".join(self._wrap(i, command) for i, command in enumerate(commands)).encode('utf-8')
+        writer = threading.Thread(target=self._write_batch, args=(batch,))
+        writer.daemon = True
+        writer.start()
+        results = []
+        output = []
+        started = time.perf_counter()
+        while len(results) < len(commands):
+            raw_line = self._process.stdout.readline()
+            if not raw_line:
+                break
+            line = raw_line.decode('utf-8', errors='replace')
+            position = line.find(self._marker)
+            if position == -1:
+                output.append(line)
+                if self.echo:
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
+                continue
+            # Output printed before the marker on the same line belongs to
+            # the command; the newline before the marker is not part of it.
+            if position > 0:
+                output.append(line[:position])
+            command_output = "".join(output)
+            if command_output.endswith("\n"):
+                command_output = command_output[:-1]
+            _, index, returncode, t0, t1 = line[position:].split()
+            try:
+                seconds = (int(t1) - int(t0)) / 1e9
+            except ValueError:
+                seconds = time.perf_counter() - started
+            results.append(CommandResult(commands[int(index)], int(returncode), seconds, command_output))
+            output = []
+            started = time.perf_counter()
+        writer.join()
+        self.results.extend(results)
+        if len(results) < len(commands):
+            returncode = self._process.poll()
+            self._process = None
+            raise SessionError("The shell in %s exited (code %s) after %d of %d commands; last output:\n%s" % (
+                self.container, returncode, len(results), len(commands), "".join(output)[-2000:]))
+        return results
+
+    # Prints the exit code and duration of every command run so far.
+    def report(self):
+        for result in self.results:
+            first_line = result.command.strip().split("\n")[0]
+            print("[%s] %7.2fs  exit %d  %s" % (self.container, result.seconds, result.returncode, first_line))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_startup.py
+#
+
+import argparse
+import re
+import subprocess
+import sys
+
+# Modules the command-line entry points must not import at startup; they are
+# loaded by the commands that use them.
+HEAVY_MODULES = ("rdflib", "requests", "wbsync", "wikidataintegrator", "internetarchive", "zstandard", "numpy")
+
+# Entry points whose startup is checked.
+CLI_MODULES = ("wikibase", "wikibase_dump")
+
+DEFAULT_BUDGET_MS = 250
+
+IMPORT_TIME_RE = re.compile(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+def main():
+
+    # Parse arguments.
+    parser=argparse.ArgumentParser(description='Checks that the command-line entry points start quickly.')
+    parser.add_argument('--budget_ms', default=DEFAULT_BUDGET_MS, type=float, help='Maximum import time of each entry point in milliseconds.')
+    parser.add_argument('--modules', default=",".join(CLI_MODULES), type=str, help='Comma-separated entry point modules to check.')
+    args=parser.parse_args()
+
+    if not check_startup(args.modules.split(","), args.budget_ms):
+        sys.exit(1)
+
+# Imports a module in a fresh interpreter with -X importtime and returns
+# {module name: cumulative import time in microseconds}.
+def get_import_times(module):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("Importing %s failed: %s" % (module, result.stderr.strip().splitlines()[-1]))
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+# Returns the heavy modules (or their submodules) that were imported.
+def get_heavy_imports(times):
+    return sorted(name for name in times if name.split(".")[0] in HEAVY_MODULES)
+
+# Checks every entry point against the time budget and the list of heavy
+# modules. Prints a line per module and returns True if all of them pass.
+def check_startup(modules, budget_ms=DEFAULT_BUDGET_MS):
+    passed = True
+    for module in modules:
+        times = get_import_times(module)
+        elapsed_ms = times.get(module, 0) / 1000.0
+        heavy = get_heavy_imports(times)
+        ok = elapsed_ms <= budget_ms and not heavy
+        passed = passed and ok
+        print("%-4s %-16s %8.1f ms (budget %.0f ms)%s" % ("OK" if ok else "FAIL", module, elapsed_ms, budget_ms,
+            "; imports " + ", ".join(heavy) if heavy else ""))
+    return passed
+
+if __name__ == '__main__':
+    main()
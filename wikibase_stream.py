@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_stream.py
+#
+
+import contextlib
+import hashlib
+import math
+import os
+import re
+import tempfile
+
+from urllib.parse import urljoin
+
+# File extensions that can be split into statements without a full parse.
+STREAMABLE_EXTENSIONS = ('.ttl', '.turtle', '.nt')
+
+# Rough ratio between the size of RDF text and the size of the rdflib graphs
+# built from it (source and target are both held while a chunk is diffed).
+GRAPH_MEMORY_FACTOR = 20
+
+# Upper bound on the number of bucket files open at once per input file.
+MAX_BUCKETS = 256
+
+NORMAL_RE = re.compile(r'"""|\'\'\'|["\'<#\[\]()]|_:|\.(?=[\s#]|$)')
+STRING_END_RE = {
+    '"': re.compile(r'\\.|"'),
+    "'": re.compile(r"\\.|'"),
+    '"""': re.compile(r'\\.|"""'),
+    "'''": re.compile(r"\\.|'''")
+}
+SPARQL_DIRECTIVE_RE = re.compile(r'(?i)(PREFIX|BASE)\s')
+PREFIX_RE = re.compile(r'(?i)@?prefix\s+([^\s:]*):\s*<([^>]*)>')
+BASE_RE = re.compile(r'(?i)@?base\s+<([^>]*)>')
+LOCAL_ESCAPE_RE = re.compile(r'\\(.)')
+BNODE_LABEL_RE = re.compile(r'[A-Za-z0-9_](?:[A-Za-z0-9_.\-]*[A-Za-z0-9_\-])?')
+
+# Returns True if the file can be imported with the streaming mode.
+def is_streamable(file_path):
+    return str(file_path).lower().endswith(STREAMABLE_EXTENSIONS)
+
+# Yields (is_directive, text, bnode_labels) for every top-level statement in a
+# Turtle or N-Triples file, reading it line by line. bnode_labels lists the
+# labelled blank nodes (_:label) the statement mentions, in order.
+def iter_statements(f):
+    buf = []
+    depth = 0
+    string_delim = None
+    in_iri = False
+    bnode_labels = []
+    for line in f:
+        if not buf and string_delim is None and not in_iri:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            if SPARQL_DIRECTIVE_RE.match(stripped):
+                yield (True, line, False)
+                continue
+        start = 0
+        i = 0
+        end = len(line)
+        while i < end:
+            if in_iri:
+                j = line.find('>', i)
+                if j == -1:
+                    i = end
+                else:
+                    in_iri = False
+                    i = j + 1
+            elif string_delim is not None:
+                m = STRING_END_RE[string_delim].search(line, i)
+                if m is None:
+                    if len(string_delim) == 1:
+                        string_delim = None # Unterminated short string; resynchronize at end of line.
+                    i = end
+                else:
+                    i = m.end()
+                    if m.group() == string_delim:
+                        string_delim = None
+            else:
+                m = NORMAL_RE.search(line, i)
+                if m is None:
+                    i = end
+                    continue
+                token = m.group()
+                i = m.end()
+                if token == '<':
+                    in_iri = True
+                elif token in STRING_END_RE:
+                    string_delim = token
+                elif token == '#':
+                    i = end
+                elif token == '_:':
+                    label = BNODE_LABEL_RE.match(line, i)
+                    if label:
+                        bnode_labels.append(label.group())
+                        i = label.end()
+                elif token in '[(':
+                    depth += 1
+                elif token in '])':
+                    depth = max(depth - 1, 0)
+                elif token == '.' and depth == 0:
+                    buf.append(line[start:i])
+                    text = ''.join(buf)
+                    stripped = text.lstrip()
+                    yield (stripped.startswith('@'), text if text.endswith('\n') else text + '\n', bnode_labels)
+                    buf = []
+                    bnode_labels = []
+                    start = i
+        if start < end:
+            rest = line[start:]
+            if buf or (rest.strip() and not rest.lstrip().startswith('#')):
+                buf.append(rest)
+    if buf and ''.join(buf).strip():
+        yield (False, ''.join(buf), bnode_labels)
+
+# Expands the subject of a statement to a full IRI (or None for blank nodes).
+def get_statement_subject(statement, prefixes, base=None):
+    text = statement.lstrip()
+    if text.startswith('<'):
+        iri = text[1:text.find('>')]
+        if base:
+            iri = urljoin(base, iri)
+        return iri
+    if text.startswith(('[', '(', '_:')):
+        return None
+    token = text.split(None, 1)[0]
+    if ':' in token:
+        prefix, local = token.split(':', 1)
+        if prefix in prefixes:
+            return prefixes[prefix] + LOCAL_ESCAPE_RE.sub(r'\1', local)
+    return token
+
+# Yields (is_directive, text, bnode_labels, subject) for every statement of a
+# file, with the subject expanded using the prefix and base directives seen
+# so far (None for blank node subjects and directives).
+def iter_file_statements(file_path):
+    prefixes = {}
+    base = None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for is_directive, text, bnode_labels in iter_statements(f):
+            if is_directive or SPARQL_DIRECTIVE_RE.match(text.lstrip()):
+                prefix_match = PREFIX_RE.match(text.strip())
+                base_match = BASE_RE.match(text.strip())
+                if prefix_match:
+                    prefixes[prefix_match.group(1)] = urljoin(base, prefix_match.group(2)) if base else prefix_match.group(2)
+                elif base_match:
+                    base = urljoin(base, base_match.group(1)) if base else base_match.group(1)
+                yield (True, text, bnode_labels, None)
+            else:
+                yield (False, text, bnode_labels, get_statement_subject(text, prefixes, base))
+
+# Yields the statements of a file as Turtle texts of about batch_bytes each,
+# every one starting with the directives seen so far so that it can be parsed
+# on its own.
+def iter_statement_batches(file_path, batch_bytes):
+    directives = []
+    batch = []
+    size = 0
+    for is_directive, text, _, _ in iter_file_statements(file_path):
+        if is_directive:
+            directives.append(text)
+            continue
+        batch.append(text)
+        size += len(text)
+        if size >= batch_bytes:
+            yield "".join(directives + batch)
+            batch = []
+            size = 0
+    if batch:
+        yield "".join(directives + batch)
+
+class UnionFind:
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        parent = self.parent.setdefault(key, key)
+        while parent != key:
+            grandparent = self.parent[parent]
+            self.parent[key] = grandparent
+            key, parent = parent, grandparent
+        return key
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if b < a:
+                a, b = b, a
+            self.parent[b] = a
+        return a
+
+    # Returns the members of every set, keyed by the set's root.
+    def groups(self):
+        groups = {}
+        for key in self.parent:
+            groups.setdefault(self.find(key), []).append(key)
+        return groups
+
+# Finds the blank node closures of a file: the labelled blank nodes joined by
+# the statements that mention them, together with the subjects of those
+# statements. Returns (owners, subject_groups): owners maps every "_:label"
+# to the IRI subject owning its closure (the smallest one) or, for closures
+# no IRI subject refers to, to the smallest label; subject_groups lists the
+# IRI subjects that share a closure.
+def get_bnode_owners(file_path):
+    closures = UnionFind()
+    if file_path:
+        for is_directive, _, bnode_labels, subject in iter_file_statements(file_path):
+            if is_directive or not bnode_labels:
+                continue
+            keys = ["_:" + label for label in bnode_labels]
+            if subject is not None:
+                keys.append(subject)
+            for key in keys:
+                closures.union(keys[0], key)
+    owners = {}
+    subject_groups = []
+    for members in closures.groups().values():
+        subjects = sorted(key for key in members if not key.startswith("_:"))
+        owner = subjects[0] if subjects else min(members)
+        for key in members:
+            if key.startswith("_:"):
+                owners[key] = owner
+        if len(subjects) > 1:
+            subject_groups.append(subjects)
+    return owners, subject_groups
+
+# Returns the bucket a subject (or blank node closure owner) is written to.
+def get_subject_bucket(subject, bucket_count):
+    if bucket_count <= 1:
+        return 0
+    digest = hashlib.md5(subject.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % bucket_count
+
+# Returns the bucket of a statement: that of its subject, or for statements
+# about blank nodes, that of the owner of their closure. Anonymous statements
+# ([ ... ] or ( ... ) as subject, no labels) are spread by their text.
+def get_statement_bucket(text, bnode_labels, subject, owners, bucket_count):
+    if subject is not None:
+        return get_subject_bucket(subject, bucket_count)
+    if bnode_labels:
+        return get_subject_bucket(owners["_:" + bnode_labels[0]], bucket_count)
+    return get_subject_bucket(text.strip(), bucket_count)
+
+# Splits a file into bucket files so that all statements about one subject,
+# with the blank node closures it owns, end up in the same bucket. Prefix and
+# base directives are copied into every bucket. Returns a list of
+# (path, statement_count) tuples.
+def partition_file(file_path, bucket_dir, bucket_count, name, owners):
+    paths = [os.path.join(bucket_dir, "%s-%04d.ttl" % (name, i)) for i in range(bucket_count)]
+    counts = [0] * bucket_count
+    with contextlib.ExitStack() as stack:
+        buckets = [stack.enter_context(open(p, 'w', encoding='utf-8')) for p in paths]
+        if file_path:
+            for is_directive, text, bnode_labels, subject in iter_file_statements(file_path):
+                if is_directive:
+                    for bucket in buckets:
+                        bucket.write(text)
+                    continue
+                index = get_statement_bucket(text, bnode_labels, subject, owners, bucket_count)
+                buckets[index].write(text)
+                counts[index] += 1
+    return list(zip(paths, counts))
+
+def get_chunk_bytes(memory_limit_bytes):
+    return max(memory_limit_bytes // GRAPH_MEMORY_FACTOR, 1)
+
+# Returns the number of buckets needed to keep each chunk under the ceiling.
+def get_bucket_count(total_bytes, memory_limit_bytes):
+    needed = max(int(math.ceil(total_bytes / float(get_chunk_bytes(memory_limit_bytes)))), 1)
+    if needed > MAX_BUCKETS:
+        print("Warning: %d buckets would be needed to stay under %d MB, but at most %d are used; chunks may exceed the limit." % (
+            needed, memory_limit_bytes // (1024 * 1024), MAX_BUCKETS))
+    return min(needed, MAX_BUCKETS)
+
+# Returns lists of bucket indexes that have to be synchronized together
+# because subjects in them share blank node closures (in either file).
+def get_bucket_groups(bucket_count, subject_groups):
+    groups = UnionFind()
+    for index in range(bucket_count):
+        groups.find(index)
+    for subjects in subject_groups:
+        for subject in subjects[1:]:
+            groups.union(get_subject_bucket(subjects[0], bucket_count), get_subject_bucket(subject, bucket_count))
+    return [sorted(indexes) for _, indexes in sorted(groups.groups().items())]
+
+def read_buckets(buckets, indexes):
+    texts = []
+    for index in indexes:
+        with open(buckets[index][0], 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    return "".join(texts), sum(buckets[index][1] for index in indexes)
+
+# Yields (source_chunk, target_chunk) strings holding the statements of the
+# same subjects from both files. Chunks that are identical are skipped. A
+# subject is always in the same chunk in both files, so its removals and
+# additions are applied together. A warning is printed for chunks that are
+# larger than the memory limit allows (e.g. one huge blank node closure).
+@contextlib.contextmanager
+def subject_chunks(target_file, source_file=None, memory_limit_bytes=256 * 1024 * 1024):
+    total_bytes = os.path.getsize(target_file)
+    if source_file:
+        total_bytes += os.path.getsize(source_file)
+    bucket_count = get_bucket_count(total_bytes, memory_limit_bytes)
+    target_owners, target_groups = get_bnode_owners(target_file)
+    source_owners, source_groups = get_bnode_owners(source_file)
+    bucket_groups = get_bucket_groups(bucket_count, target_groups + source_groups)
+    chunk_bytes = get_chunk_bytes(memory_limit_bytes)
+    with tempfile.TemporaryDirectory(prefix="wikibase-stream-") as bucket_dir:
+        target_buckets = partition_file(target_file, bucket_dir, bucket_count, "target", target_owners)
+        source_buckets = partition_file(source_file, bucket_dir, bucket_count, "source", source_owners)
+        def chunks():
+            for indexes in bucket_groups:
+                source_chunk, source_count = read_buckets(source_buckets, indexes)
+                target_chunk, target_count = read_buckets(target_buckets, indexes)
+                if source_count == 0 and target_count == 0:
+                    continue
+                if source_chunk == target_chunk:
+                    continue
+                if len(source_chunk) + len(target_chunk) > chunk_bytes:
+                    print("Warning: a chunk of %.1f MB is larger than the %.1f MB the memory limit allows." % (
+                        (len(source_chunk) + len(target_chunk)) / 1e6, chunk_bytes / 1e6))
+                yield (source_chunk if source_count > 0 else "", target_chunk)
+        yield chunks()
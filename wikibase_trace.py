@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_trace.py
+#
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from wikibase_session import CommandSession
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS and child CPU time are not recorded.
+    resource = None
+
+STATM_PATH = "/proc/self/statm"
+
+TRACE_DIR = "traces"
+
+# The tracer that phases and commands are recorded into, if tracing is on.
+active_tracer = None
+
+def get_trace_dir(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), TRACE_DIR)
+
+# Returns the peak resident set size in KB this process has reached so far,
+# or None where the resource module is missing. It never goes down, so it
+# says nothing about the phase that is running.
+def get_peak_rss_kb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    if sys.platform == "darwin":
+        # Reported in bytes on macOS and in KB elsewhere.
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+# Returns the current resident set size in KB of this process, or None where
+# /proc is not available.
+def get_rss_kb():
+    try:
+        with open(STATM_PATH, 'r') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+# Returns the CPU seconds used so far by this process and by its finished children.
+def get_cpu_seconds():
+    cpu = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+def format_command(command):
+    if isinstance(command, (list, tuple)):
+        command = " ".join(str(part) for part in command)
+    return str(command).strip().split("\n")[0]
+
+# Records phases and commands with their wall time, CPU time and exit code,
+# and phases with the RSS of this process when they end. Events are appended
+# to a JSON Lines file as they finish and are written as a Chrome trace
+# (chrome://tracing, Perfetto) when tracing ends; the summary also gives the
+# peak RSS of the whole run. CPU time of 'docker exec' commands only covers
+# the docker client on the host, not the work done inside the container.
+# subprocess.run calls and container session commands are recorded
+# automatically; commands started with subprocess.Popen are recorded by their
+# callers with record_command.
+class Tracer:
+
+    def __init__(self, trace_dir):
+        self.trace_dir = trace_dir
+        self.events = []
+        self.started = time.perf_counter()
+        self.name = time.strftime("trace-%Y%m%d-%H%M%S")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._original_run = None
+        self._original_flush = None
+        self._finished = False
+        os.makedirs(trace_dir, exist_ok=True)
+        self.jsonl_path = os.path.join(trace_dir, self.name + ".jsonl")
+        self.chrome_path = os.path.join(trace_dir, self.name + ".json")
+        self._jsonl = open(self.jsonl_path, 'w')
+
+    def get_depth(self):
+        return getattr(self._local, "depth", 0)
+
+    def record(self, kind, name, start, wall, cpu=None, rss_kb=None, returncode=None, **extra):
+        event = {
+            "kind": kind,
+            "name": name,
+            "start": round(start - self.started, 6),
+            "wall": round(wall, 6),
+            "cpu": round(cpu, 6) if cpu is not None else None,
+            "rss_kb": rss_kb,
+            "returncode": returncode,
+            "depth": self.get_depth(),
+            "thread": threading.get_ident()
+        }
+        event.update(extra)
+        with self._lock:
+            self.events.append(event)
+            if not self._jsonl.closed:
+                self._jsonl.write(json.dumps(event) + "\n")
+                self._jsonl.flush()
+        return event
+
+    # Times a block as a phase; phases can nest.
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        cpu_start = get_cpu_seconds()
+        self._local.depth = self.get_depth() + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            self.record("phase", name, start, time.perf_counter() - start, get_cpu_seconds() - cpu_start,
+                get_rss_kb())
+
+    def traced_run(self, *args, **kwargs):
+        command = args[0] if args else kwargs.get("args")
+        start = time.perf_counter()
+        cpu_start = get_cpu_seconds()
+        returncode = None
+        try:
+            result = self._original_run(*args, **kwargs)
+            returncode = result.returncode
+            return result
+        finally:
+            self.record("command", format_command(command), start, time.perf_counter() - start,
+                get_cpu_seconds() - cpu_start, returncode=returncode)
+
+    # Records each command run in a container shell session; their timings
+    # come from the session itself, one after the other from the flush.
+    def traced_flush(self, session):
+        start = time.perf_counter()
+        results = self._original_flush(session)
+        for result in results:
+            self.record("command", format_command(result.command), start, result.seconds,
+                returncode=result.returncode, container=session.container)
+            start += result.seconds
+        return results
+
+    # Starts recording every subprocess.run call and container session command.
+    def install(self):
+        global active_tracer
+        if self._original_run is None:
+            tracer = self
+            self._original_run = subprocess.run
+            self._original_flush = CommandSession.flush
+            subprocess.run = self.traced_run
+            CommandSession.flush = lambda session: tracer.traced_flush(session)
+        active_tracer = self
+        return self
+
+    def uninstall(self):
+        global active_tracer
+        if self._original_run is not None:
+            subprocess.run = self._original_run
+            CommandSession.flush = self._original_flush
+            self._original_run = None
+            self._original_flush = None
+        if active_tracer is self:
+            active_tracer = None
+
+    def write_chrome_trace(self):
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            args = dict((key, value) for key, value in event.items()
+                if key not in ("kind", "name", "start", "wall", "thread") and value is not None)
+            trace_events.append({
+                "name": event["name"],
+                "cat": event["kind"],
+                "ph": "X",
+                "ts": int(event["start"] * 1e6),
+                "dur": int(event["wall"] * 1e6),
+                "pid": pid,
+                "tid": event["thread"],
+                "args": args
+            })
+        with open(self.chrome_path, 'w') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+    # Prints every phase in start order, then the slowest commands.
+    def summary(self, command_count=15):
+        total = time.perf_counter() - self.started
+        print("%-50s %9s %9s %11s %5s" % ("Phase", "Wall (s)", "CPU (s)", "RSS at end", "%"))
+        for event in sorted((e for e in self.events if e["kind"] == "phase"), key=lambda e: e["start"]):
+            name = "  " * (event["depth"]) + event["name"]
+            rss = "%.0f MB" % (event["rss_kb"] / 1024) if event["rss_kb"] is not None else "-"
+            print("%-50s %9.2f %9.2f %11s %5.1f" % (name[:50], event["wall"], event["cpu"] or 0.0, rss,
+                100.0 * event["wall"] / total if total else 0.0))
+        commands = sorted((e for e in self.events if e["kind"] == "command"), key=lambda e: -e["wall"])
+        if commands:
+            print("\n%-72s %9s %5s" % ("Slowest commands", "Wall (s)", "Exit"))
+            for event in commands[:command_count]:
+                returncode = "-" if event["returncode"] is None else str(event["returncode"])
+                print("%-72s %9.2f %5s" % (event["name"][:72], event["wall"], returncode))
+            failed = sum(1 for e in commands if e["returncode"] not in (None, 0))
+            print("%d commands, %d with a non-zero exit code." % (len(commands), failed))
+        peak_rss_kb = get_peak_rss_kb()
+        if peak_rss_kb is not None:
+            print("Peak RSS of the run: %.0f MB." % (peak_rss_kb / 1024))
+        print("Total %.1fs. Trace written to %s and %s." % (total, self.jsonl_path, self.chrome_path))
+
+    def finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self.uninstall()
+        with self._lock:
+            self._jsonl.close()
+        self.write_chrome_trace()
+        self.summary()
+
+# Starts tracing for the rest of the run; the trace is written and the
+# summary printed at exit (including exit() calls).
+def start_tracing(yaml_dict):
+    tracer = Tracer(get_trace_dir(yaml_dict)).install()
+    atexit.register(tracer.finish)
+    return tracer
+
+@contextlib.contextmanager
+def tracing(yaml_dict):
+    tracer = Tracer(get_trace_dir(yaml_dict)).install()
+    try:
+        yield tracer
+    finally:
+        tracer.finish()
+
+# Records a command started with subprocess.Popen at start (a
+# time.perf_counter() value) once it has finished, while tracing is on.
+def record_command(command, start, returncode):
+    tracer = active_tracer
+    if tracer is not None:
+        tracer.record("command", format_command(command), start, time.perf_counter() - start, returncode=returncode)
+
+# Times a block as a phase while tracing is on.
+def trace_phase(name):
+    tracer = active_tracer
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.phase(name)
+
+# Decorator that records a function as a phase while tracing is on. The
+# phase is named after the function unless a name is given.
+def phase(name=None):
+    def decorator(func):
+        phase_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_phase(phase_name):
+                return func(*args, **kwargs)
+        return wrapper
+    if callable(name):
+        func, name = name, None
+        return decorator(func)
+    return decorator
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_triples.py
+#
+
+from array import array
+from bisect import bisect_left, bisect_right
+from rdflib import Graph
+from rdflib.store import Store
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Compact rdflib store: every term is interned once and triples are kept as
+# three columns of term IDs, sorted by (subject, predicate, object) and free of
+# duplicates once compacted. Triples can be added while parsing; the columns
+# are compacted on the first read after that. Besides the subject order of the
+# columns, it keeps lazy indexes by predicate (used for rdf:type) and by
+# object. Contexts and formulae are not supported.
+class InternedStore(Store):
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        super(InternedStore, self).__init__(configuration)
+        self.identifier = identifier
+        self.terms = []
+        self.term_ids = {}
+        self.subjects = array('I')
+        self.predicates = array('I')
+        self.objects = array('I')
+        self._compact = True
+        self._predicate_rows = None
+        self._object_rows = None
+        self._namespace = {}
+        self._prefix = {}
+
+    # Builds a compacted store from a term list and its columns, e.g. as read
+    # back from the graph cache.
+    @classmethod
+    def from_columns(cls, terms, subjects, predicates, objects):
+        store = cls()
+        store.terms = list(terms)
+        store.term_ids = dict((term, term_id) for term_id, term in enumerate(store.terms))
+        store.subjects, store.predicates, store.objects = subjects, predicates, objects
+        store._compact = False
+        store.compact()
+        return store
+
+    def intern(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.term_ids[term] = term_id
+            self.terms.append(term)
+        return term_id
+
+    def add(self, triple, context=None, quoted=False):
+        s, p, o = triple
+        self.subjects.append(self.intern(s))
+        self.predicates.append(self.intern(p))
+        self.objects.append(self.intern(o))
+        self._compact = False
+
+    def addN(self, quads):
+        for s, p, o, _ in quads:
+            self.add((s, p, o))
+
+    def remove(self, triple_pattern, context=None):
+        rows = set(self.match_rows(triple_pattern))
+        if rows:
+            keep = [row for row in range(len(self.subjects)) if row not in rows]
+            self.subjects = array('I', (self.subjects[row] for row in keep))
+            self.predicates = array('I', (self.predicates[row] for row in keep))
+            self.objects = array('I', (self.objects[row] for row in keep))
+            self._predicate_rows = None
+            self._object_rows = None
+
+    # Sorts the columns by (subject, predicate, object) and drops duplicates.
+    def compact(self):
+        if self._compact:
+            return
+        columns = (self.subjects, self.predicates, self.objects)
+        bits = max(len(self.terms) - 1, 1).bit_length()
+        if numpy is not None:
+            rows = numpy.unique(numpy.stack([numpy.frombuffer(column, dtype=numpy.uint32) for column in columns], axis=1), axis=0)
+            self.subjects, self.predicates, self.objects = (array('I', rows[:, i].tobytes()) for i in range(3))
+        elif 3 * bits <= 64:
+            # Pack each triple into one integer so that sorting stays cheap.
+            mask = (1 << bits) - 1
+            keys = sorted(set((s << (2 * bits)) | (p << bits) | o for s, p, o in zip(*columns)))
+            self.subjects = array('I', (key >> (2 * bits) for key in keys))
+            self.predicates = array('I', ((key >> bits) & mask for key in keys))
+            self.objects = array('I', (key & mask for key in keys))
+        else:
+            rows = sorted(set(zip(*columns)))
+            self.subjects, self.predicates, self.objects = (array('I', (row[i] for row in rows)) for i in range(3))
+        self._compact = True
+        self._predicate_rows = None
+        self._object_rows = None
+
+    # Returns {predicate ID: array of rows}.
+    def get_predicate_rows(self):
+        self.compact()
+        if self._predicate_rows is None:
+            predicate_rows = {}
+            for row, p in enumerate(self.predicates):
+                rows = predicate_rows.get(p)
+                if rows is None:
+                    rows = predicate_rows[p] = array('I')
+                rows.append(row)
+            self._predicate_rows = predicate_rows
+        return self._predicate_rows
+
+    # Returns (sorted object IDs, rows in the same order).
+    def get_object_rows(self):
+        self.compact()
+        if self._object_rows is None:
+            rows = sorted(range(len(self.objects)), key=self.objects.__getitem__)
+            self._object_rows = (array('I', (self.objects[row] for row in rows)), array('I', rows))
+        return self._object_rows
+
+    # Returns the rows of the triples that match a pattern (None matches
+    # anything).
+    def match_rows(self, triple_pattern):
+        self.compact()
+        ids = []
+        for term in triple_pattern:
+            if term is None:
+                ids.append(None)
+            else:
+                term_id = self.term_ids.get(term)
+                if term_id is None:
+                    return iter(())
+                ids.append(term_id)
+        s, p, o = ids
+        if s is not None:
+            rows = range(bisect_left(self.subjects, s), bisect_right(self.subjects, s))
+        elif p is not None:
+            rows = self.get_predicate_rows().get(p, ())
+        elif o is not None:
+            sorted_objects, object_rows = self.get_object_rows()
+            rows = object_rows[bisect_left(sorted_objects, o):bisect_right(sorted_objects, o)]
+        else:
+            rows = range(len(self.subjects))
+        if p is not None and s is not None:
+            rows = (row for row in rows if self.predicates[row] == p)
+        if o is not None and (s is not None or p is not None):
+            rows = (row for row in rows if self.objects[row] == o)
+        return iter(rows)
+
+    def triples(self, triple_pattern, context=None):
+        terms = self.terms
+        for row in self.match_rows(triple_pattern):
+            yield (terms[self.subjects[row]], terms[self.predicates[row]], terms[self.objects[row]]), iter(())
+
+    # Yields (s, p, o) term ID triples in (subject, predicate, object) order.
+    def iter_ids(self):
+        self.compact()
+        return zip(self.subjects, self.predicates, self.objects)
+
+    # Yields (subject, triples) for every subject, in subject ID order.
+    def iter_subject_groups(self):
+        self.compact()
+        terms = self.terms
+        start = 0
+        count = len(self.subjects)
+        while start < count:
+            end = bisect_right(self.subjects, self.subjects[start], start)
+            yield terms[self.subjects[start]], [(terms[self.subjects[row]], terms[self.predicates[row]], terms[self.objects[row]])
+                for row in range(start, end)]
+            start = end
+
+    def __len__(self, context=None):
+        self.compact()
+        return len(self.subjects)
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix, namespace, override=True):
+        if not override and (prefix in self._namespace or namespace in self._prefix):
+            return
+        self._prefix[namespace] = prefix
+        self._namespace[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix, None)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace, None)
+
+    def namespaces(self):
+        for prefix, namespace in self._namespace.items():
+            yield prefix, namespace
+
+# Returns an empty graph backed by an InternedStore.
+def new_graph():
+    return Graph(store=InternedStore())
+
+# Parses a file into a graph backed by an InternedStore.
+def parse_graph(file_path):
+    g = new_graph()
+    g.parse(file_path)
+    return g
+
+# Returns the InternedStore behind a graph, or None.
+def get_interned_store(g):
+    store = getattr(g, "store", None)
+    return store if isinstance(store, InternedStore) else None
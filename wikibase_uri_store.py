@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_uri_store.py
+#
+
+import os
+import sqlite3
+import threading
+import time
+
+from wikibase_wqs import get_entity_id
+
+URI_STORE_FILE = "uri_store.sqlite3"
+
+# SQLite limits the number of parameters in one statement.
+LOOKUP_CHUNK_SIZE = 500
+
+def get_uri_store_path(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), URI_STORE_FILE)
+
+# Removes the stored mappings of a project (e.g. when its Wikibase is reset).
+def clear_uri_store(yaml_dict):
+    for suffix in ("", "-wal", "-shm"):
+        store_path = get_uri_store_path(yaml_dict) + suffix
+        if os.path.isfile(store_path):
+            os.remove(store_path)
+
+# Persistent map of ontology URIs to the Wikibase entities created for them.
+# Every write is its own transaction; lookups can be done in bulk.
+class URIStore:
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS uri_map ("
+                "uri TEXT PRIMARY KEY, wb_uri TEXT NOT NULL, entity_id TEXT, updated REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS uri_map_entity_id ON uri_map (entity_id)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, uri):
+        with self._lock:
+            row = self._conn.execute("SELECT wb_uri FROM uri_map WHERE uri = ?", (str(uri),)).fetchone()
+        return row[0] if row else None
+
+    # Returns {uri: wb_uri} for the URIs that are known.
+    def get_many(self, uris):
+        uris = list(set(str(uri) for uri in uris))
+        found = {}
+        with self._lock:
+            for i in range(0, len(uris), LOOKUP_CHUNK_SIZE):
+                chunk = uris[i:i + LOOKUP_CHUNK_SIZE]
+                query = "SELECT uri, wb_uri FROM uri_map WHERE uri IN (%s)" % ",".join("?" * len(chunk))
+                found.update(self._conn.execute(query, chunk).fetchall())
+        return found
+
+    # Returns the URI mapped to an entity ID (e.g. Q42), or None.
+    def get_uri_for_entity(self, entity_id):
+        with self._lock:
+            row = self._conn.execute("SELECT uri FROM uri_map WHERE entity_id = ?", (entity_id,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, uri, wb_uri):
+        self.put_many([(uri, wb_uri)])
+
+    def put_many(self, pairs):
+        now = time.time()
+        rows = [(str(uri), str(wb_uri), get_entity_id(wb_uri), now) for uri, wb_uri in pairs]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO uri_map (uri, wb_uri, entity_id, updated) VALUES (?, ?, ?, ?)", rows)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM uri_map")
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM uri_map").fetchone()[0]
+
+    # Makes a URI factory class (e.g. wbsync's URIFactoryMock) read through to
+    # and write through to this store. get_uri falls back to the store when
+    # the factory does not know a URI; post_uri also saves the mapping. Like
+    # the factory, both take wbsync elements and key the store on their uri.
+    def attach(self, factory_class):
+        if getattr(factory_class, "_uri_store", None) is None:
+            original_get_uri = factory_class.get_uri
+            original_post_uri = factory_class.post_uri
+            def get_uri(factory, label):
+                wb_uri = original_get_uri(factory, label)
+                store = factory_class._uri_store
+                if wb_uri is None and store is not None:
+                    wb_uri = store.get(label.uri)
+                    if wb_uri is not None:
+                        original_post_uri(factory, label, wb_uri)
+                return wb_uri
+            def post_uri(factory, label, wb_uri):
+                result = original_post_uri(factory, label, wb_uri)
+                store = factory_class._uri_store
+                if store is not None:
+                    store.put(label.uri, wb_uri)
+                return result
+            factory_class._original_post_uri = original_post_uri
+            factory_class.get_uri = get_uri
+            factory_class.post_uri = post_uri
+        factory_class._uri_store = self
+        return self
+
+    # Loads the known mappings of the given wbsync elements into a factory in
+    # one lookup.
+    def preload(self, factory, elements):
+        elements = {element.uri: element for element in elements}
+        found = self.get_many(elements)
+        post_uri = getattr(type(factory), "_original_post_uri", type(factory).post_uri)
+        for uri, wb_uri in found.items():
+            post_uri(factory, elements[uri], wb_uri)
+        return len(found)
+
+def open_uri_store(yaml_dict):
+    return URIStore(get_uri_store_path(yaml_dict))
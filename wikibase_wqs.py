@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+#
+#   Clair Kronk
+#   18 October 2026
+#   wikibase_wqs.py
+#
+
+import json
+import os
+import re
+import subprocess
+import time
+import wikibase_trace
+
+from wikibase_config import get_sync_setting
+from wikibase_session import CommandSession, SessionError
+
+DUMP_RDF_COMMAND = "php /var/www/html/extensions/Wikibase/repo/maintenance/dumpRdf.php"
+
+WDQS_CONTAINER = "wbs-deploy-wdqs-1"
+SPARQL_UPDATE_URL = "http://localhost:9999/bigdata/namespace/wdq/sparql"
+
+TOUCHED_ENTITIES_FILE = "touched_entities.json"
+
+# Paths used by an incremental update inside the containers.
+DELTA_LIST_PATH = "/tmp/wqs_delta_entities.txt"
+DELTA_RDF_PATH = "/tmp/wqs_delta.ttl"
+DELTA_MUNGE_DIR = "/tmp/wqs_delta"
+DELTA_UPDATE_PATH = "/tmp/wqs_delta.rq"
+
+ENTITY_ID_RE = re.compile(r"([PQL]\d+)$")
+
+# How the dump is compressed between the containers, as
+# (command appended in the wikibase container, command receiving it in the
+# query service container, file extension munge.sh reads).
+COMPRESSION = {
+    "none": ("", "cat > %s", ""),
+    # munge.sh reads gzipped dumps directly, so the file stays compressed.
+    "gzip": (" | gzip -1 -c", "cat > %s", ".gz"),
+    # Needs the zstd binary in both containers.
+    "zstd": (" | zstd -1 -c", "zstd -d -c > %s", "")
+}
+
+# Streams dumpRdf.php output from the wikibase container straight into a
+# file in the query service container, without copying it through the
+# host's temporary directory. Extra dumpRdf.php arguments (such as
+# --list-file) are passed through. Returns the path of the dump in the query
+# service container, or None if the export, its compression or the transfer
+# failed.
+@wikibase_trace.phase
+def stream_rdf(yaml_dict=None, rdf_path="/tmp/backup.ttl", compression=None, chunk_size=1024*1024, dump_arguments=""):
+    if compression is None:
+        compression = get_sync_setting(yaml_dict, "rdf_compression", "none") or "none"
+    export_suffix, load_command, extension = COMPRESSION[compression]
+    rdf_path += extension
+
+    export_command = 'docker exec wbs-deploy-wikibase-1 //bin//bash -c "set -o pipefail; %s%s%s"' % (DUMP_RDF_COMMAND, dump_arguments, export_suffix)
+    receive_command = 'docker exec -i %s //bin//bash -c "%s"' % (WDQS_CONTAINER, load_command % rdf_path)
+    start = time.perf_counter()
+    export = subprocess.Popen(export_command, shell=True, stdout=subprocess.PIPE)
+    load = subprocess.Popen(receive_command, shell=True, stdin=subprocess.PIPE)
+
+    bytes_moved = 0
+    first_byte = None
+    try:
+        while True:
+            chunk = export.stdout.read1(chunk_size) if hasattr(export.stdout, 'read1') else export.stdout.read(chunk_size)
+            if not chunk:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            load.stdin.write(chunk)
+            bytes_moved += len(chunk)
+    except BrokenPipeError:
+        print("The query service container stopped reading the RDF dump early.")
+        # Nothing reads the rest of the dump, so the export would block on a
+        # full pipe forever; stop it instead of waiting for it.
+        export.kill()
+    export.stdout.close()
+    export_returncode = export.wait()
+    export_seconds = time.perf_counter() - start
+    try:
+        load.stdin.close()
+    except BrokenPipeError:
+        pass
+    load_returncode = load.wait()
+    transfer_seconds = time.perf_counter() - start
+    wikibase_trace.record_command(export_command, start, export_returncode)
+    wikibase_trace.record_command(receive_command, start, load_returncode)
+
+    print("Streamed RDF dump to %s:%s (%s): %.1f MB moved; first byte after %.1fs, export finished after %.1fs (exit %d), transfer finished after %.1fs (exit %d)." % (
+        WDQS_CONTAINER, rdf_path, compression, bytes_moved / 1e6, first_byte or 0.0, export_seconds, export_returncode,
+        transfer_seconds, load_returncode))
+    if export_returncode != 0 or load_returncode != 0:
+        return None
+    return rdf_path
+
+def get_touched_entities_path(yaml_dict):
+    return os.path.join("./target/"+str(yaml_dict["repo"]), TOUCHED_ENTITIES_FILE)
+
+# Returns the entity IDs touched by imports since the query service was last
+# updated, as {"entities": [...], "unresolved": n}, or None if nothing has
+# been recorded (in which case the query service state is unknown).
+def load_touched_entities(yaml_dict):
+    touched_path = get_touched_entities_path(yaml_dict)
+    if os.path.isfile(touched_path):
+        with open(touched_path, 'r') as f:
+            return json.load(f)
+    return None
+
+# Adds entity IDs touched by an import. Subjects that could not be mapped to
+# an entity ID are counted as unresolved, which forces a full reload.
+def add_touched_entities(yaml_dict, entity_ids, unresolved=0):
+    touched = load_touched_entities(yaml_dict) or {"entities": [], "unresolved": 0}
+    touched["entities"] = sorted(set(touched["entities"]) | set(entity_ids))
+    touched["unresolved"] += unresolved
+    touched_path = get_touched_entities_path(yaml_dict)
+    os.makedirs(os.path.dirname(touched_path), exist_ok=True)
+    tmp_path = touched_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(touched, f, indent=2)
+    os.replace(tmp_path, touched_path)
+
+# Marks the query service as in sync with the Wikibase instance.
+def reset_touched_entities(yaml_dict):
+    touched_path = get_touched_entities_path(yaml_dict)
+    os.makedirs(os.path.dirname(touched_path), exist_ok=True)
+    with open(touched_path, 'w') as f:
+        json.dump({"entities": [], "unresolved": 0}, f, indent=2)
+
+# Forgets the recorded entities, so that the next update is a full reload.
+def clear_touched_entities(yaml_dict):
+    touched_path = get_touched_entities_path(yaml_dict)
+    if os.path.isfile(touched_path):
+        os.remove(touched_path)
+
+# Returns the entity ID (e.g. Q42) at the end of an entity URI or ID, or None.
+def get_entity_id(uri):
+    if not uri:
+        return None
+    m = ENTITY_ID_RE.search(str(uri))
+    if m is None:
+        return None
+    return m.group(1)
+
+# Builds a SPARQL update that removes everything the query service holds
+# about the entities (their own triples, their statement nodes and their
+# EntityData triples) and then loads the munged delta files.
+def build_delta_update(concept_uri, entity_ids, munged_paths):
+    entity_prefix = concept_uri + "/entity/"
+    values = " ".join("<%s%s>" % (entity_prefix, entity_id) for entity_id in entity_ids)
+    update = [
+        "DELETE { ?s ?p ?o } WHERE {",
+        "  VALUES ?entity { %s }" % values,
+        "  { BIND(?entity AS ?s) ?s ?p ?o }",
+        "  UNION { ?entity ?statement_property ?s . FILTER(STRSTARTS(STR(?s), \"%sstatement/\")) ?s ?p ?o }" % entity_prefix,
+        "  UNION { ?s <http://schema.org/about> ?entity . ?s ?p ?o }",
+        "}"
+    ]
+    for munged_path in munged_paths:
+        update.append(";")
+        update.append("LOAD <file://%s>" % munged_path)
+    return "\n".join(update) + "\n"
+
+# Updates the query service with only the entities touched since the last
+# update: exports them with dumpRdf.php --list-file, munges the export and
+# replaces their triples in one SPARQL update. Returns False if a full
+# reload is needed instead (nothing recorded, unresolved subjects, too many
+# entities, or a failed step).
+@wikibase_trace.phase
+def sync_incremental(yaml_dict):
+    try:
+        return apply_incremental(yaml_dict)
+    except SessionError as e:
+        print("%s; a full query service reload is needed." % e)
+        return False
+
+def apply_incremental(yaml_dict):
+    touched = load_touched_entities(yaml_dict)
+    if touched is None:
+        print("No record of touched entities; a full query service reload is needed.")
+        return False
+    if touched["unresolved"] > 0:
+        print("%d imported subjects could not be mapped to entity IDs; a full query service reload is needed." % touched["unresolved"])
+        return False
+    entity_ids = touched["entities"]
+    if not entity_ids:
+        print("No entities changed since the last query service update.")
+        return True
+    limit = get_sync_setting(yaml_dict, "wqs_incremental_limit", 10000)
+    if len(entity_ids) > limit:
+        print("%d entities changed (limit %d); a full query service reload is needed." % (len(entity_ids), limit))
+        return False
+    if "wikibase_public_host" not in yaml_dict["wikibase"]:
+        print("No public host declared; a full query service reload is needed.")
+        return False
+    concept_uri = 'https://' + yaml_dict["wikibase"]["wikibase_public_host"]
+
+    start = time.perf_counter()
+    with CommandSession(echo=False) as wikibase_session:
+        wikibase_session.queue_text("\n".join(entity_ids), DELTA_LIST_PATH)
+    if not all(result.successful for result in wikibase_session.results):
+        print("Could not write the entity list into the wikibase container.")
+        return False
+
+    rdf_path = stream_rdf(yaml_dict, rdf_path=DELTA_RDF_PATH, dump_arguments=" --list-file %s" % DELTA_LIST_PATH)
+    if rdf_path is None:
+        print("Exporting the delta failed; a full query service reload is needed.")
+        return False
+
+    with CommandSession(container=WDQS_CONTAINER) as wdqs_session:
+        wdqs_session.queue("rm -rf %s && mkdir -p %s" % (DELTA_MUNGE_DIR, DELTA_MUNGE_DIR))
+        wdqs_session.queue("./munge.sh -f %s -d %s -- --conceptUri %s" % (rdf_path, DELTA_MUNGE_DIR, concept_uri))
+        listing = wdqs_session.queue("ls %s" % DELTA_MUNGE_DIR).flush()[-1]
+        munged_paths = [os.path.join(DELTA_MUNGE_DIR, name).replace(os.sep, "/")
+            for name in listing.output.split() if name.endswith(".ttl.gz")]
+        if not all(result.successful for result in wdqs_session.results) or not munged_paths:
+            print("Munging the delta failed; a full query service reload is needed.")
+            return False
+        wdqs_session.queue_text(build_delta_update(concept_uri, entity_ids, munged_paths), DELTA_UPDATE_PATH)
+        wdqs_session.queue("curl -sf -X POST --data-urlencode update@%s %s" % (DELTA_UPDATE_PATH, SPARQL_UPDATE_URL))
+        wdqs_session.flush()
+    wdqs_session.report()
+    if not all(result.successful for result in wdqs_session.results):
+        print("Applying the delta failed; a full query service reload is needed.")
+        return False
+
+    reset_touched_entities(yaml_dict)
+    print("Updated %d entities in the query service in %.1fs." % (len(entity_ids), time.perf_counter() - start))
+    return True